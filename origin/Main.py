@@ -1,22 +1,48 @@
+import time
+startupMarks = [("start", time.perf_counter())]                                                                        #printed once the start page is up
+
 import PyQt6.QtWidgets as Qtw
 import PyQt6.QtGui as QtGui
 import PyQt6.QtCore as Qtc
-import PyQt6.QtMultimedia as Qtmedia
-from PyQt6.QtMultimediaWidgets import QVideoWidget
-from PyQt6.QtQml import QQmlApplicationEngine
-from scrape import Scraper, Booru, Penscrape, GoogleImagesApi
+import PyQt6.QtNetwork as Qtnet
+from PyQt6 import sip
 
 import json
+import sqlite3
 import os
-import shutil
-import requests
+import hashlib
 import threading
+import bisect
+import heapq
+from collections import deque, OrderedDict
 from functools import partial
 # from io import BytesIO
 
 
 
+def startupMark(name):
+    startupMarks.append((name, time.perf_counter()))
+
+def reportStartup(budget=1.0):
+    startupMark("first frame")
+    steps = ["{} {:.0f} ms".format(name, (at - startupMarks[i][1]) * 1000) for i, (name, at) in enumerate(startupMarks[1:])]
+    total = startupMarks[-1][1] - startupMarks[0][1]
+    print("startup: " + ", ".join(steps) + " | total {:.0f} ms".format(total * 1000))
+    if total > budget:
+        print("startup over its {:.0f} ms budget".format(budget * 1000))
+
+def multimedia():                                                                                                       #QtMultimedia brings up its backends on import, so wait until a video plays
+    import PyQt6.QtMultimedia as Qtmedia
+    return Qtmedia
+
+def scraping():                                                                                                         #the site adapters pull in their own http stack, so wait until a feed opens
+    import scrape
+    return scrape
+
+startupMark("imports")
 app = Qtw.QApplication([])
+Qtc.QLoggingCategory.setFilterRules("qt.gui.imageio.jpeg.warning=false")                                               #partial jpeg renders are expected while streaming
+startupMark("application")
 
 
 class AtomicInteger:
@@ -41,23 +67,1261 @@ class AtomicInteger:
             return self.value
         
 
+class PageCursor:                                                                                                       #hands every page loader its own pid, the site object only ever sees one at a time
+    attempts = 3                                                                                                        #tries per pid before a failing page is skipped
+
+    def __init__(self, scraper, tagKey):
+        self.scraper = scraper
+        self.tagKey = tagKey
+        self.lock = threading.Lock()
+        self.claimLock = threading.Lock()
+        self.nextPid = scraper.site.pid
+        self.exhausted = False
+        self.retry = []
+        self.failures = {}
+
+    def claim(self):
+        with self.claimLock:
+            if self.retry:                                                                                              #failed pages go first, the oldest gap before new ones
+                return self.retry.pop(0)
+            pid = self.nextPid
+            self.nextPid += 1
+            return pid
+
+    def giveBack(self, pid):
+        with self.claimLock:
+            self.failures[pid] = self.failures.get(pid, 0) + 1
+            if self.failures[pid] < self.attempts:
+                self.retry.append(pid)
+                self.retry.sort()
+
+    def fetch(self, pid):
+        with self.lock:
+            site = self.scraper.site
+            site.pid = pid
+            siteJson = site.retJson()
+            if siteJson:
+                L = site.imagePop2(siteJson)
+            else:
+                L = site.imagePop()
+        if isinstance(siteJson, list):
+            tagsFor(self.tagKey).learnPosts(siteJson)
+        return siteJson, L
+
+class EngineTask(Qtc.QObject):
+    finished = Qtc.pyqtSignal(object)
+    failed = Qtc.pyqtSignal(str)
+    received = Qtc.pyqtSignal(int)
+
+    def __init__(self, url="", head=False, stream=False):
+        super().__init__()
+        self.url = url
+        self.head = head
+        self.stream = stream
+        self.buffer = bytearray()
+        self.reply = None
+        self.headers = {}
+        self.cancelled = False
+        self.status = None
+
+    def abort(self):
+        self.cancelled = True
+        if self.reply is not None:
+            self.reply.abort()
+
+
+class MediaCache:                                                                                                       #url keyed, content addressed, least recently used goes first
+    def __init__(self, root, budget=1024*1024*1024):
+        self.root = root
+        self.budget = budget
+        self.lock = threading.RLock()
+        self.indexPath = os.path.join(root, 'index.json')
+        self.entries = OrderedDict()
+        self.refs = {}
+        self.total = 0
+        self.dirty = 0
+        self.doomed = deque()
+        self.sweeping = False
+        self.writing = set()
+        self.load()
+        threading.Thread(target=self.clearOrphans, daemon=True).start()
+
+    def load(self):
+        try:
+            with open(self.indexPath, 'r') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return
+        for key, url, name, size in index.get("entries", []):
+            if os.path.exists(os.path.join(self.root, name[:2], name)):
+                self.add(key, url, name, size)
+
+    def add(self, key, url, name, size):
+        self.entries[key] = [url, name, size]
+        self.refs[name] = self.refs.get(name, 0) + 1
+        if self.refs[name] == 1:
+            self.total += size
+
+    def drop(self, key):
+        url, name, size = self.entries.pop(key)
+        self.refs[name] -= 1
+        if self.refs[name] == 0:
+            del self.refs[name]
+            self.total -= size
+            self.doomed.append(name)
+
+    def sweep(self):                                                                                                    #deletes happen off the gui thread, a blob stored again meanwhile is spared
+        with self.lock:
+            if self.sweeping or not self.doomed:
+                return
+            self.sweeping = True
+        threading.Thread(target=self.sweepDoomed, daemon=True).start()
+
+    def sweepDoomed(self):
+        while True:
+            with self.lock:
+                if not self.doomed:
+                    self.sweeping = False
+                    return
+                name = self.doomed.popleft()
+                if name in self.refs:
+                    continue
+                try:
+                    os.remove(os.path.join(self.root, name[:2], name))
+                except OSError:
+                    pass
+
+    def clearOrphans(self):                                                                                             #anything not in the index, loose files from older versions included
+        for folder, dirs, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(folder, name)
+                with self.lock:
+                    if path == self.indexPath or path == self.indexPath + '.part' or path in self.writing:
+                        continue
+                    if name in self.refs and folder == os.path.join(self.root, name[:2]):
+                        continue
+                    if name.endswith('.part') and name[:-5] in self.refs:
+                        continue
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def key(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def has(self, url):                                                                                                 #memory only, safe to ask from the gui thread
+        if saveCatalog.has(url):
+            return True
+        with self.lock:
+            return self.key(url) in self.entries
+
+    def savedPath(self, url):
+        path = saveCatalog.pathOf(url)
+        if path and os.path.exists(path):
+            return path
+        return None
+
+    def path(self, url):
+        saved = self.savedPath(url)
+        if saved:
+            return saved
+        with self.lock:
+            entry = self.entries.get(self.key(url))
+            if entry is None:
+                return None
+            self.entries.move_to_end(self.key(url))
+            self.dirty += 1
+            return os.path.join(self.root, entry[1][:2], entry[1])
+
+    def get(self, url):
+        path = self.path(url)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def put(self, url, data):
+        name = hashlib.sha256(data).hexdigest() + os.path.splitext(Qtc.QUrl(url).path())[1].lower()[:8]
+        folder = os.path.join(self.root, name[:2])
+        path = os.path.join(folder, name)
+        with self.lock:
+            fresh = name not in self.refs or not os.path.exists(path)                                                 #a blob deleted behind our back gets written again
+            part = "{}.{}.part".format(path, threading.get_ident())
+            if fresh:
+                self.writing.add(part)
+        if fresh:                                                                                                       #bytes go to disk outside the lock so lookups never wait on a write
+            try:
+                os.makedirs(folder, exist_ok=True)
+                with open(part, 'wb') as file:
+                    file.write(data)
+            except OSError:
+                with self.lock:
+                    self.writing.discard(part)
+                try:
+                    os.remove(part)
+                except OSError:
+                    pass
+                raise
+        with self.lock:
+            if fresh:
+                self.writing.discard(part)
+                os.replace(part, path)
+            key = self.key(url)
+            if key in self.entries and self.entries[key][1] == name:                                                    #same bytes fetched twice, dropping would delete the file
+                self.entries.move_to_end(key)
+            else:
+                if key in self.entries:
+                    self.drop(key)
+                self.add(key, url, name, len(data))
+            self.evict()
+            self.dirty += 1
+            if self.dirty >= 32:
+                self.flush()
+        return path
+
+    def evict(self):
+        with self.lock:
+            while self.total > self.budget and len(self.entries) > 1:
+                self.drop(next(iter(self.entries)))
+        self.sweep()
+
+    def flush(self):
+        with self.lock:
+            os.makedirs(self.root, exist_ok=True)
+            index = {"entries": [[key] + entry for key, entry in self.entries.items()]}
+            with open(self.indexPath + '.part', 'w') as file:
+                json.dump(index, file)
+            os.replace(self.indexPath + '.part', self.indexPath)
+            self.dirty = 0
+
+
+class PixmapCache:                                                                                                      #decoded pixmaps by url and target size, bounded by bytes, gui thread only
+    def __init__(self, budget=256*1024*1024):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, url, size):
+        if size is None:
+            return (url, -1, -1)
+        return (url, size.width(), size.height())
+
+    def cost(self, pixmap):
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
+
+    def get(self, url, size):
+        key = self.key(url, size)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, url, size, pixmap):
+        key = self.key(url, size)
+        if key in self.entries:
+            self.total -= self.cost(self.entries.pop(key))
+        self.entries[key] = pixmap
+        self.total += self.cost(pixmap)
+        self.evict()
+
+    def evict(self):
+        while self.total > self.budget and self.entries:
+            key, pixmap = self.entries.popitem(last=False)
+            self.total -= self.cost(pixmap)
+            self.evictions += 1
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.total, "budget": self.budget, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class FetchEngine(Qtc.QObject):                                                                                         #every download goes through one network manager on the gui event loop
+    def __init__(self, perHost=6, callThreads=2):
+        super().__init__()
+        self.manager = Qtnet.QNetworkAccessManager(self)
+        self.manager.setTransferTimeout(10000)
+        self.perHost = perHost
+        self.active = {}
+        self.queued = {}
+                                                                                                                        #scrape adapters only offer blocking calls, they get a small fixed pool
+        self.callPool = Qtc.QThreadPool(self)
+        self.callPool.setMaxThreadCount(callThreads)
+        self.ioPool = Qtc.QThreadPool(self)                                                                             #cache reads and writes, the gui thread only asks the index
+        self.ioPool.setMaxThreadCount(2)
+        self.io = set()
+
+    def fetch(self, url, head=False, stream=False):
+        task = EngineTask(url, head, stream)
+        if not head and cacheFor(url).has(url):
+            self.onIo(partial(self.serveCached, task), cacheFor(url).get, url)
+            return task
+        self.enqueue(task)
+        return task
+
+    def enqueue(self, task):
+        host = Qtc.QUrl(task.url).host()
+        self.queued.setdefault(host, deque()).append(task)
+        self.pump(host)
+
+    def onIo(self, done, fn, *args):                                                                                    #held until it reports back, a collected task would drop the signal
+        io = runOnPool(self.ioPool, fn, *args)
+        self.io.add(io)
+        io.finished.connect(partial(self.ioDone, io, done))
+        io.failed.connect(partial(self.ioFailed, io, done))
+
+    def ioDone(self, io, done, result):
+        self.io.discard(io)
+        done(result)
+
+    def ioFailed(self, io, done, error):
+        print(error)
+        self.ioDone(io, done, None)
+
+    def call(self, fn, *args):
+        return runOnPool(self.callPool, fn, *args)
+
+    def pump(self, host):
+        queue = self.queued.get(host)
+        while queue and self.active.get(host, 0) < self.perHost:
+            task = queue.popleft()
+            if task.cancelled:
+                continue
+            request = Qtnet.QNetworkRequest(Qtc.QUrl(task.url))
+            if task.head:
+                task.reply = self.manager.head(request)
+            else:
+                task.reply = self.manager.get(request)
+            self.active[host] = self.active.get(host, 0) + 1
+            if task.stream:
+                task.reply.readyRead.connect(partial(self.replyReadyRead, task))
+            task.reply.finished.connect(partial(self.replyFinished, host, task))
+
+    def serveCached(self, task, data):
+        if task.cancelled:
+            return
+        if data is None:                                                                                                #evicted or unreadable since the index said yes
+            self.enqueue(task)
+            return
+        if task.stream:
+            task.buffer = bytearray(data)
+            task.received.emit(len(data))
+        task.finished.emit(data)
+
+    def stored(self, task, data, path):
+        if not task.cancelled:
+            task.finished.emit(data)
+
+    def replyReadyRead(self, task):
+        if task.reply is None:
+            return
+        task.buffer += bytes(task.reply.readAll())
+        task.received.emit(len(task.buffer))
+
+    def replyFinished(self, host, task):
+        reply = task.reply
+        task.reply = None
+        self.active[host] -= 1
+        task.status = reply.attribute(Qtnet.QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+        if task.cancelled:                                                                                              #finished before the abort could land
+            pass
+        elif reply.error() == Qtnet.QNetworkReply.NetworkError.NoError:
+            task.headers = {bytes(k).decode('latin-1').lower(): bytes(v).decode('latin-1') for k, v in reply.rawHeaderPairs()}
+            if task.stream:
+                task.buffer += bytes(reply.readAll())
+                data = bytes(task.buffer)
+            else:
+                data = bytes(reply.readAll())
+            if task.head:
+                task.finished.emit(data)
+            else:                                                                                                       #finished waits for the write so callers find the file in the cache
+                self.onIo(partial(self.stored, task, data), cacheFor(task.url).put, task.url, data)
+        else:
+            task.failed.emit(task.url + ": " + reply.errorString())
+        reply.deleteLater()
+        self.pump(host)
 
-class MainWindow(Qtw.QMainWindow):
 
-    settings_file = os.path.join('origin', 'settings.json')
-    with open(settings_file, 'r') as file:
-        settings_dict = json.load(file)
-        searchList = settings_dict["searchList"]
-        colorTheme = settings_dict["colorTheme"]
-        colorOptions = settings_dict["colorOptions"]
-        auto_scroll = settings_dict["auto_scroll"]
-        backgroundTheme = settings_dict["backgroundTheme"]
-        originalSizedImages = settings_dict["originalSize"]
-        nsfw = settings_dict["NSFW"]
-        tool_tips = settings_dict["tool_tips"]
+def runOnPool(pool, fn, *args):
+    task = EngineTask()
+    Qtc.QTimer.singleShot(0, partial(pool.start, partial(runTask, task, fn, args)))                                     #start once the caller has connected
+    return task
 
+def runTask(task, fn, args):
+    if task.cancelled:
+        return
+    try:
+        result = fn(*args)
+    except Exception as e:
+        if not task.cancelled:
+            task.failed.emit(str(e))
+        return
+    if not task.cancelled and not sip.isdeleted(task):
+        task.finished.emit(result)
+
+
+def sizeBucket(width, height, step=256):
+    return Qtc.QSize(-(-int(width) // step) * step, -(-int(height) // step) * step)
+
+def perceptualHash(data):                                                                                               #dhash, brightness steps across a 9x8 grayscale shrink
+    image = decodeImage(data, Qtc.QSize(64, 64))
+    if image.isNull():
+        return None
+    small = image.convertToFormat(QtGui.QImage.Format.Format_Grayscale8).scaled(
+        9, 8, Qtc.Qt.AspectRatioMode.IgnoreAspectRatio, Qtc.Qt.TransformationMode.SmoothTransformation)
+    value = 0
+    for y in range(8):
+        for x in range(8):
+            value = value << 1 | (QtGui.qGray(small.pixel(x, y)) > QtGui.qGray(small.pixel(x + 1, y)))
+    return value
+
+def fingerprinted(dhash):                                                                                               #flat pictures all hash to the same few values
+    return dhash is not None and 4 <= dhash.bit_count() <= 60
+
+def decodeImage(data, target=None):
+    buffer = Qtc.QBuffer()
+    buffer.setData(Qtc.QByteArray(data))
+    buffer.open(Qtc.QIODevice.OpenModeFlag.ReadOnly)
+    reader = QtGui.QImageReader(buffer)
+    if target is not None:
+        size = reader.size()
+        if size.isValid() and (size.width() > target.width() or size.height() > target.height()):
+            reader.setScaledSize(size.scaled(target, Qtc.Qt.AspectRatioMode.KeepAspectRatio))                          #decoder scales while reading, full size never lands in memory
+    image = reader.read()
+    if image.isNull():
+        return image
+    return image.convertToFormat(QtGui.QImage.Format.Format_ARGB32_Premultiplied)                                     #cheapest format for the raster paint engine
+
+def decodeImageFile(path, target=None):
+    with open(path, 'rb') as file:
+        return decodeImage(file.read(), target)
+
+
+class ImageDecoder(Qtc.QObject):                                                                                        #pixmaps are made on the gui thread, everything before that happens here
     def __init__(self):
         super().__init__()
+        self.pool = Qtc.QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, Qtc.QThread.idealThreadCount() - 1))
+
+    def decode(self, data, target=None):
+        return runOnPool(self.pool, decodeImage, data, target)
+
+    def decodeFile(self, path, target=None):
+        return runOnPool(self.pool, decodeImageFile, path, target)
+
+    def thumbnail(self, path):
+        return runOnPool(self.pool, thumbStore.load, path)
+
+
+class ThumbnailStore:                                                                                                   #small pre-scaled copies of saved files, named by file and mtime so a changed file gets a new one
+    size = Qtc.QSize(256, 256)
+
+    def __init__(self, root):
+        self.root = root
+        self.backlog = deque()
+        self.queued = set()
+        self.filling = False
+
+    def path(self, path):
+        stat = os.stat(path)
+        key = hashlib.sha1("{}:{}:{}".format(os.path.basename(path), stat.st_mtime_ns, stat.st_size).encode('utf-8')).hexdigest()
+        ext = '.png' if os.path.splitext(path)[1].lower() in ('.png', '.gif', '.webp') else '.jpg'                      #keep transparency where the source has it
+        return os.path.join(self.root, key[:2], key + ext)
+
+    def load(self, path):                                                                                               #decoder thread, reads the thumbnail or makes it
+        try:
+            thumb = self.path(path)
+        except OSError:
+            return QtGui.QImage()
+        if os.path.exists(thumb):
+            image = decodeImageFile(thumb)
+            if not image.isNull():
+                return image
+        return self.make(path, thumb)
+
+    def make(self, path, thumb=None):
+        try:
+            thumb = thumb or self.path(path)
+            image = decodeImageFile(path, self.size)
+        except OSError:
+            return QtGui.QImage()
+        if image.isNull():
+            return image
+        part = "{}.{}.part".format(thumb, threading.get_ident())                                                        #load and fill may make the same thumbnail at once
+        try:
+            os.makedirs(os.path.dirname(thumb), exist_ok=True)
+            if image.save(part, 'PNG' if thumb.endswith('.png') else 'JPG', 85):
+                os.replace(part, thumb)
+        except OSError as e:
+            print(e)
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+        return image
+
+    def fill(self, path):
+        try:
+            if os.path.exists(self.path(path)):
+                return
+        except OSError:
+            return
+        self.make(path)
+
+    def generate(self, path):
+        return runOnPool(imageDecoder.pool, self.fill, path)
+
+    def remove(self, path):                                                                                             #before the file goes, its name and mtime are the key
+        try:
+            os.remove(self.path(path))
+        except OSError:
+            pass
+
+    def sweep(self, paths):                                                                                             #thumbnails of files deleted by hand or rewritten since
+        startedAt = time.time()
+        keep = set()
+        for path in paths:
+            try:
+                keep.add(os.path.basename(self.path(path)))
+            except OSError:
+                pass
+        for folder, dirs, files in os.walk(self.root):
+            for name in files:
+                thumb = os.path.join(folder, name)
+                if name in keep or name.endswith('.part'):
+                    continue
+                try:
+                    if os.path.getmtime(thumb) < startedAt:                                                             #one made during the sweep belongs to a new save
+                        os.remove(thumb)
+                except OSError:
+                    pass
+
+    def backfill(self, paths):                                                                                          #one at a time so it never crowds out the decodes on screen
+        for path in paths:
+            if path not in self.queued:
+                self.queued.add(path)
+                self.backlog.append(path)
+        if not self.filling:
+            self.fillNext()
+
+    def fillNext(self, *args):
+        if not self.backlog:
+            self.filling = False
+            return
+        self.filling = True
+        path = self.backlog.popleft()
+        self.queued.discard(path)
+        task = self.generate(path)
+        task.finished.connect(self.fillNext)
+        task.failed.connect(self.fillNext)
+
+
+class HammingIndex:                                                                                                     #pigeonhole lookup, hashes within radius agree exactly on one of radius + 1 slices
+    def __init__(self, radius, bits=64):
+        self.radius = radius
+        edges = [bits * i // (radius + 1) for i in range(radius + 2)]
+        self.slices = [(low, (1 << (high - low)) - 1) for low, high in zip(edges, edges[1:])]
+        self.tables = [{} for _ in self.slices]
+
+    def add(self, value, key):
+        for (shift, mask), table in zip(self.slices, self.tables):
+            table.setdefault(value >> shift & mask, []).append((value, key))
+
+    def find(self, value):
+        seen = set()
+        found = []
+        for (shift, mask), table in zip(self.slices, self.tables):
+            for other, key in table.get(value >> shift & mask, ()):
+                if key not in seen:
+                    seen.add(key)
+                    distance = (value ^ other).bit_count()
+                    if distance <= self.radius:
+                        found.append((distance, key))
+        return found
+
+
+class TagIndex:                                                                                                         #tag to the set of save ids carrying it, queries intersect the shortest lists first
+    def __init__(self):
+        self.postings = {}
+        self.tagsOf = {}
+
+    def add(self, id, tags):
+        self.discard(id)
+        self.tagsOf[id] = tags
+        for tag in tags:
+            self.postings.setdefault(tag, set()).add(id)
+
+    def discard(self, id):
+        for tag in self.tagsOf.pop(id, ()):
+            posting = self.postings[tag]
+            posting.discard(id)
+            if not posting:
+                del self.postings[tag]
+
+    def search(self, include, exclude):
+        if include:
+            postings = sorted((self.postings.get(tag, set()) for tag in include), key=len)
+            found = set(postings[0])
+            for posting in postings[1:]:
+                if not found:
+                    break
+                found &= posting
+        else:
+            found = set(self.tagsOf)
+        for tag in exclude:
+            found -= self.postings.get(tag, set())
+        return found
+
+
+def postTags(text):
+    if not text:
+        return set()
+    try:
+        post = json.loads(text)
+    except ValueError:
+        return set()
+    if not isinstance(post, dict):
+        return set()
+    tags = post.get('tags') or ''
+    tags = set((tags.split() if isinstance(tags, str) else map(str, tags)))
+    if post.get('rating'):
+        tags.add('rating:' + str(post['rating']))                                                                       #same spelling the metadata dropdown searches with
+    return set(tag.lower() for tag in tags)
+
+
+class SaveCatalog:                                                                                                      #what the hearts point at, one row per saved post
+    nearDistance = 6                                                                                                    #dhash bits two reposts of the same picture may differ by
+    orders = {
+        "Newest": "savedAt DESC, id DESC",
+        "Oldest": "savedAt ASC, id ASC",
+        "Largest": "width * height DESC, id DESC",
+        "Name": "path ASC, id ASC",
+    }
+
+    def __init__(self, path, folder):
+        self.path = path
+        self.folder = folder
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS saves ("
+            "id INTEGER PRIMARY KEY, url TEXT UNIQUE, path TEXT UNIQUE NOT NULL, json TEXT, "
+            "width INTEGER, height INTEGER, savedAt REAL NOT NULL, stored INTEGER NOT NULL DEFAULT 0)")
+        columns = set(row[1] for row in self.db.execute("PRAGMA table_info(saves)"))
+        for column in ("sha256 TEXT", "dhash TEXT"):
+            if column.split()[0] not in columns:
+                self.db.execute("ALTER TABLE saves ADD COLUMN " + column)
+        self.db.execute("CREATE INDEX IF NOT EXISTS savesByTime ON saves (savedAt)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS savesByHash ON saves (sha256)")
+                                                                                                                        #other urls of a picture that is already saved, with the post each came from
+        self.db.execute("CREATE TABLE IF NOT EXISTS aliases (url TEXT PRIMARY KEY, saveId INTEGER NOT NULL, json TEXT)")
+        if "json" not in set(row[1] for row in self.db.execute("PRAGMA table_info(aliases)")):
+            self.db.execute("ALTER TABLE aliases ADD COLUMN json TEXT")
+        self.urls = set(url for url, in self.db.execute("SELECT url FROM saves WHERE url IS NOT NULL UNION SELECT url FROM aliases"))
+        self.index = None
+        self.tags = None
+        self.released = {}                                                                                              #path to the url that last unsaved it
+        self.importLegacy(os.path.join(os.path.dirname(path), 'saves.txt'))
+        threading.Thread(target=self.reconcile, daemon=True).start()
+
+    def importLegacy(self, textPath):                                                                                   #saves.txt from before the catalog, kept aside once read
+        if not os.path.exists(textPath):
+            return
+        with open(textPath, 'r') as file:
+            urls = [line.strip() for line in file if line.strip()]
+        for url in urls:
+            path = os.path.join(self.folder, os.path.basename(url))
+            if os.path.exists(path):
+                self.add(url, path, None, savedAt=os.path.getmtime(path))
+                self.stored(path)
+        os.replace(textPath, textPath + '.imported')
+
+    def has(self, url):
+        return url in self.urls
+
+    def pathOf(self, url):
+        if url not in self.urls:
+            return None
+        with self.lock:
+            row = self.db.execute(
+                "SELECT path FROM saves WHERE stored = 1 AND (url = ? OR id = (SELECT saveId FROM aliases WHERE url = ?))",
+                (url, url)).fetchone()
+        return row[0] if row else None
+
+    def freePath(self, url):                                                                                            #same file name from another url gets the url hash appended
+        name = os.path.basename(url)
+        path = os.path.join(self.folder, name)
+        if self.heldByOther(path, url):
+            stem, ext = os.path.splitext(name)
+            path = os.path.join(self.folder, stem + '-' + hashlib.sha1(url.encode('utf-8')).hexdigest()[:8] + ext)
+        return path
+
+    def heldByOther(self, path, url):
+        with self.lock:
+            row = self.db.execute("SELECT url FROM saves WHERE path = ?", (path,)).fetchone()
+            if row is not None:
+                return row[0] != url
+            return os.path.exists(path) and self.released.get(path) != url                                             #a file this url's unsave has not deleted yet is still its own
+
+    def add(self, url, path, json=None, savedAt=None):
+        with self.lock:
+            added = self.db.execute(
+                "INSERT OR IGNORE INTO saves (url, path, json, savedAt) VALUES (?, ?, ?, ?)",
+                (url, path, jsonText(json), savedAt or time.time())).rowcount == 1
+            if added and url:
+                self.urls.add(url)
+        return added
+
+    def stored(self, path, digest=None, dhash=None):
+        size = QtGui.QImageReader(path).size()                                                                          #header only
+        with self.lock:
+            self.db.execute("UPDATE saves SET stored = 1, width = ?, height = ? WHERE path = ?",
+                            (max(size.width(), 0), max(size.height(), 0), path))
+            if self.tags is not None:
+                for id, in self.db.execute("SELECT id FROM saves WHERE path = ?", (path,)).fetchall():
+                    self.tags.add(id, self.rowTags(id))
+            if digest is not None:
+                self.hashed(path, digest, dhash)
+
+    def hashed(self, path, digest, dhash):
+        with self.lock:
+            row = self.db.execute("SELECT id FROM saves WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                return
+            self.db.execute("UPDATE saves SET sha256 = ?, dhash = ? WHERE id = ?",
+                            (digest, None if dhash is None else format(dhash, '016x'), row[0]))
+            if self.index is not None and fingerprinted(dhash):
+                self.index.add(dhash, row[0])
+
+    def hashIndex(self):                                                                                                #built on the first save that needs it
+        if self.index is None:
+            self.index = HammingIndex(self.nearDistance)
+            for id, dhash in self.db.execute("SELECT id, dhash FROM saves WHERE stored = 1 AND dhash IS NOT NULL"):
+                if fingerprinted(int(dhash, 16)):
+                    self.index.add(int(dhash, 16), id)
+        return self.index
+
+    def claimDuplicate(self, url, digest, dhash):                                                                       #an exact or near match turns this url into an alias of the saved copy
+        with self.lock:
+            match = self.db.execute("SELECT id, path FROM saves WHERE sha256 = ? AND stored = 1 LIMIT 1", (digest,)).fetchone()
+            if match is None and fingerprinted(dhash):
+                for distance, id in sorted(self.hashIndex().find(dhash)):
+                    row = self.db.execute("SELECT id, path, dhash FROM saves WHERE id = ? AND stored = 1", (id,)).fetchone()
+                    if row and row[2] and (int(row[2], 16) ^ dhash).bit_count() <= self.nearDistance:               #ids are reused after deletes, so check the row still matches
+                        match = row[:2]
+                        break
+            if match is None:
+                return None
+            row = self.db.execute("SELECT json FROM saves WHERE url = ?", (url,)).fetchone()
+            if row is None:                                                                                             #unsaved while the bytes were being hashed
+                return None
+            self.db.execute("DELETE FROM saves WHERE url = ?", (url,))
+            self.db.execute("INSERT OR REPLACE INTO aliases (url, saveId, json) VALUES (?, ?, ?)", (url, match[0], row[0]))
+            if self.tags is not None:                                                                                   #the repost's tags find the kept copy too
+                self.tags.add(match[0], self.rowTags(match[0]))
+            return match[1]
+
+    def remove(self, url):
+        with self.lock:
+            self.urls.discard(url)
+            alias = self.db.execute("SELECT saveId FROM aliases WHERE url = ?", (url,)).fetchone()
+            if alias is not None:
+                self.db.execute("DELETE FROM aliases WHERE url = ?", (url,))
+                if self.tags is not None and alias[0] in self.tags.tagsOf:
+                    self.tags.add(alias[0], self.rowTags(alias[0]))
+                return None
+            row = self.db.execute("SELECT id, path FROM saves WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self.dropRow(row[0])
+            self.released[row[1]] = url
+        return row[1]
+
+    def dropRow(self, id):
+        with self.lock:
+            self.urls.difference_update(url for url, in self.db.execute("SELECT url FROM aliases WHERE saveId = ?", (id,)))
+            self.db.execute("DELETE FROM aliases WHERE saveId = ?", (id,))
+            self.db.execute("DELETE FROM saves WHERE id = ?", (id,))
+            if self.tags is not None:
+                self.tags.discard(id)
+
+    def rowTags(self, id):                                                                                              #a save's own tags and those of every repost folded into it
+        with self.lock:
+            row = self.db.execute("SELECT json FROM saves WHERE id = ?", (id,)).fetchone()
+            tags = postTags(row[0]) if row else set()
+            for text, in self.db.execute("SELECT json FROM aliases WHERE saveId = ?", (id,)):
+                tags |= postTags(text)
+        return tags
+
+    def tagIndex(self):                                                                                                 #the reconcile pass builds it early, a search before that builds it here
+        with self.lock:
+            if self.tags is None:
+                tags = TagIndex()
+                for id, text in self.db.execute("SELECT id, json FROM saves WHERE stored = 1"):
+                    tags.add(id, postTags(text))
+                for id, text in self.db.execute("SELECT saveId, json FROM aliases WHERE json IS NOT NULL"):
+                    if id in tags.tagsOf:
+                        tags.add(id, tags.tagsOf[id] | postTags(text))
+                self.tags = tags
+            return self.tags
+
+    def search(self, query):                                                                                            #space separated tags, a leading - excludes
+        terms = query.lower().split()
+        include = [term for term in terms if not term.startswith('-')]
+        exclude = [term[1:] for term in terms if term.startswith('-') and len(term) > 1]
+        if not include and not exclude:
+            return None
+        with self.lock:
+            return self.tagIndex().search(include, exclude)
+
+    def page(self, offset, limit, order="Newest", matches=None):                                                        #matches narrows to the ids of a tag search
+        with self.lock:
+            if matches is None:
+                return self.db.execute(
+                    "SELECT url, path FROM saves WHERE stored = 1 ORDER BY " + self.orders[order] + " LIMIT ? OFFSET ?",
+                    (limit, offset)).fetchall()
+            return self.db.execute(
+                "SELECT url, path FROM saves WHERE stored = 1 AND id IN (SELECT value FROM json_each(?)) "
+                "ORDER BY " + self.orders[order] + " LIMIT ? OFFSET ?",
+                (json.dumps(list(matches)), limit, offset)).fetchall()
+
+    def paths(self):
+        with self.lock:
+            return [path for path, in self.db.execute("SELECT path FROM saves WHERE stored = 1")]
+
+    def reconcile(self):                                                                                                #only the names that differ between disk and catalog get touched
+        startedAt = time.time()
+        try:
+            names = set(os.listdir(self.folder))
+        except OSError:
+            names = set()
+        with self.lock:
+            known = self.db.execute("SELECT id, url, path, stored FROM saves WHERE savedAt < ?", (startedAt,)).fetchall()
+        for id, url, path, stored in known:
+            present = os.path.basename(path) in names
+            if present and not stored:                                                                                  #written but the app closed before it was marked
+                self.stored(path)
+            elif not present:                                                                                           #deleted by hand, or a download that never landed
+                with self.lock:
+                    self.urls.discard(url)
+                    self.dropRow(id)
+        with self.lock:
+            known = set(os.path.basename(path) for path, in self.db.execute("SELECT path FROM saves"))
+        for name in names - known:
+            if name.endswith('.part'):                                                                                  #a write in flight, or one a crash cut short
+                continue
+            path = os.path.join(self.folder, name)
+            reader = QtGui.QImageReader(path)
+            if not reader.canRead() and os.path.splitext(name)[1].lower() not in motionTypes:
+                continue
+            size = reader.size()
+            try:
+                savedAt = os.path.getmtime(path)
+            except OSError:
+                continue
+            with self.lock:
+                cursor = self.db.execute(
+                    "INSERT OR IGNORE INTO saves (path, width, height, savedAt, stored) VALUES (?, ?, ?, ?, 1)",
+                    (path, max(size.width(), 0), max(size.height(), 0), savedAt))
+                if cursor.rowcount and self.tags is not None:
+                    self.tags.add(cursor.lastrowid, set())
+        self.tagIndex()
+        with self.lock:
+            unhashed = [path for path, in self.db.execute("SELECT path FROM saves WHERE stored = 1 AND sha256 IS NULL")]
+        for path in unhashed:                                                                                           #saves from before hashing, so later ones can match them
+            try:
+                with open(path, 'rb') as file:
+                    data = file.read()
+            except OSError:
+                continue
+            self.hashed(path, hashlib.sha256(data).hexdigest(), perceptualHash(data))
+        thumbStore.sweep(self.paths())
+
+
+class SaveQueue(Qtc.QObject):                                                                                           #one writer thread, so a save and the unsave after it land in order
+    def __init__(self):
+        super().__init__()
+        self.pool = Qtc.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.generation = {}
+        self.fetching = {}
+
+    def bump(self, url):                                                                                                #only the newest save or unsave of a url gets to touch the disk
+        self.generation[url] = self.generation.get(url, 0) + 1
+        fetch = self.fetching.pop(url, None)
+        if fetch is not None:
+            fetch.abort()
+        return self.generation[url]
+
+    def current(self, url, generation):
+        return self.generation.get(url) == generation
+
+    def save(self, url, json=None, data=None):
+        generation = self.bump(url)
+        report = EngineTask(url)
+        path = saveCatalog.freePath(url)
+        if not saveCatalog.add(url, path, json):
+            Qtc.QTimer.singleShot(0, partial(self.fail, report, generation, "another save already uses " + os.path.basename(path)))
+            return report
+        source = None if data else cacheFor(url).path(url)                                                             #bytes the feed still holds, else the cached file
+        if data or source:
+            self.write(report, generation, path, data, source)
+            return report
+        fetch = fetchEngine.fetch(url, stream=True)                                                                     #stream so the heart can show progress
+        self.fetching[url] = fetch
+        fetch.received.connect(report.received)
+        fetch.finished.connect(partial(self.fetched, report, generation, path))
+        fetch.failed.connect(partial(self.fail, report, generation))
+        return report
+
+    def fetched(self, report, generation, path, data):
+        if self.current(report.url, generation):
+            self.fetching.pop(report.url, None)
+        self.write(report, generation, path, data, None)
+
+    def write(self, report, generation, path, data, source):
+        if not self.current(report.url, generation):
+            return
+        task = runOnPool(self.pool, self.store, report.url, generation, path, data, source)
+        task.finished.connect(partial(self.stored, report, generation))
+        task.failed.connect(partial(self.fail, report, generation))
+
+    def store(self, url, generation, path, data, source):                                                               #writer thread, gives back the saved copy this turned out to duplicate
+        if not self.current(url, generation):
+            return False, None
+        if data is None:
+            with open(source, 'rb') as file:
+                data = file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        dhash = perceptualHash(data)
+        duplicate = saveCatalog.claimDuplicate(url, digest, dhash)
+        if duplicate:
+            return True, duplicate
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.part', 'wb') as file:
+            file.write(data)
+        os.replace(path + '.part', path)
+        saveCatalog.stored(path, digest, dhash)
+        try:                                                                                                            #the file has landed, a missing thumbnail is made later
+            thumbStore.fill(path)
+        except OSError as e:
+            print(e)
+        return True, None
+
+    def stored(self, report, generation, result):
+        written, duplicate = result
+        if written and self.current(report.url, generation):
+            report.finished.emit(duplicate)
+
+    def fail(self, report, generation, error):
+        if self.current(report.url, generation):
+            self.fetching.pop(report.url, None)
+            saveCatalog.remove(report.url)
+            report.failed.emit(error)
+
+    def unsave(self, url):
+        generation = self.bump(url)
+        path = saveCatalog.remove(url)
+        if path:
+            runOnPool(self.pool, self.discard, url, generation, path)
+
+    def discard(self, url, generation, path):                                                                           #writer thread, a save queued after this one rewrites the file anyway
+        if self.current(url, generation):
+            thumbStore.remove(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            with saveCatalog.lock:
+                if saveCatalog.released.get(path) == url:
+                    del saveCatalog.released[path]
+
+
+def jsonText(value):
+    return None if value is None else json.dumps(value)
+
+
+class TagDictionary:                                                                                                    #names kept sorted so a prefix is two bisects, counts ride along in a dict
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.counts = {}
+        self.dirty = False
+        try:
+            with open(path, 'r') as file:
+                counts = json.load(file)
+            if isinstance(counts, dict):
+                self.counts = counts
+        except (OSError, ValueError):
+            pass
+        self.names = sorted(self.counts)
+
+    def learn(self, names, counts):                                                                                     #tagPop results, their counts are the site's own
+        with self.lock:
+            fresh = []
+            for name, count in zip(names, counts):
+                name = str(name).lower()
+                try:
+                    count = int(count)
+                except (TypeError, ValueError):
+                    count = 0
+                if name not in self.counts:
+                    fresh.append(name)
+                    self.counts[name] = count
+                elif count > 0:
+                    self.counts[name] = count
+            self.merge(fresh)
+            self.dirty = True
+
+    def learnPosts(self, posts):                                                                                        #tags seen on posts, counted once until tagPop says otherwise
+        with self.lock:
+            fresh = []
+            for post in posts or ():
+                tags = post.get('tags') if isinstance(post, dict) else None
+                if not isinstance(tags, str):
+                    continue
+                for name in tags.lower().split():
+                    if name not in self.counts:
+                        self.counts[name] = 1
+                        fresh.append(name)
+            self.merge(fresh)
+
+    def merge(self, fresh):
+        if fresh:
+            self.names.extend(sorted(fresh))
+            self.names.sort()                                                                                           #two sorted runs, timsort merges them in one pass
+            self.dirty = True
+
+    def suggest(self, prefix, limit=20):
+        prefix = prefix.lower()
+        if not prefix:
+            return [], []
+        with self.lock:
+            low = bisect.bisect_left(self.names, prefix)
+            high = bisect.bisect_left(self.names, prefix + '\U0010ffff', low)
+            names = heapq.nlargest(limit, self.names[low:high], key=self.counts.__getitem__)
+            return names, [self.counts[name] for name in names]
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.part', 'w') as file:
+                json.dump(self.counts, file)
+            os.replace(self.path + '.part', self.path)
+            self.dirty = False
+
+
+class GifPool(Qtc.QObject):                                                                                             #gif cards load a few at a time, each GifWorker lives on its label
+    def __init__(self, width=2):
+        super().__init__()
+        self.width = width
+        self.queue = deque()
+        self.running = set()
+
+    def load(self, label, json, slot):
+        worker = GifWorker(label, json)
+        worker.setParent(label)
+        worker.handle_gif.connect(slot)
+        worker.finished.connect(partial(self.done, worker))
+        worker.destroyed.connect(partial(self.dropped, worker))
+        self.queue.append(worker)
+        self.pump()
+        return worker
+
+    def done(self, worker):
+        if worker in self.running:
+            self.running.discard(worker)
+            worker.deleteLater()
+            self.pump()
+
+    def dropped(self, worker, *args):                                                                                   #card went away mid download
+        if worker in self.running:
+            self.running.discard(worker)
+            worker.stop()
+            self.pump()
+
+    def pump(self):
+        while self.queue and len(self.running) < self.width:
+            worker = self.queue.popleft()
+            if sip.isdeleted(worker):
+                continue
+            self.running.add(worker)
+            worker.run()
+
+
+class PlayerPool(Qtc.QObject):                                                                                          #a few media players shared by every video, made on first play
+    def __init__(self, size=3):
+        super().__init__()
+        self.size = size
+        self.idle = []
+        self.active = OrderedDict()
+
+    def checkout(self, owner):
+        if self.idle:
+            player = self.idle.pop()
+        elif len(self.active) < self.size:
+            Qtmedia = multimedia()
+            player = Qtmedia.QMediaPlayer(self)
+            audio = Qtmedia.QAudioOutput(player)
+            audio.setDevice(Qtmedia.QMediaDevices.defaultAudioOutput())
+            player.setAudioOutput(audio)
+            player.setPlaybackRate(1.0)
+        else:                                                                                                           #all busy, the longest running one gives way
+            player, previous = self.active.popitem(last=False)
+            if not sip.isdeleted(previous):
+                previous.playerLost()
+            self.reset(player)
+        self.active[player] = owner
+        owner.destroyed.connect(partial(self.ownerGone, player, owner))
+        return player
+
+    def checkin(self, player):
+        if self.active.pop(player, None) is not None:
+            self.reset(player)
+            self.idle.append(player)
+
+    def ownerGone(self, player, owner, *args):
+        if not sip.isdeleted(player) and self.active.get(player) is owner:
+            self.checkin(player)
+
+    def reset(self, player):
+        player.stop()
+        try:
+            player.positionChanged.disconnect()
+        except TypeError:
+            pass
+        player.setSource(Qtc.QUrl())
+        player.setVideoOutput(None)
+
+
+class AutocompleteService(Qtc.QObject):                                                                                 #one for the app, only the newest query of the newest page gets answered
+    suggested = Qtc.pyqtSignal(object, list, list)
+    delay = 250
+
+    def __init__(self):
+        super().__init__()
+        self.timer = Qtc.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.delay)
+        self.timer.timeout.connect(self.lookup)
+        self.current = None                                                                                             #(owner, site, key, tag) whose answer is still wanted
+        self.pending = None
+        self.task = None
+
+    def request(self, owner, site, key, tag):
+        self.current = (owner, site, key, tag)
+        names, counts = tagsFor(key).suggest(tag)
+        self.suggested.emit(owner, names, counts)
+        if tag and tag[-1].isalnum():
+            self.pending = self.current
+            self.timer.start()                                                                                          #restarting it folds a burst of keys into one lookup
+        else:
+            self.pending = None
+            self.timer.stop()
+
+    def lookup(self):
+        if self.task is not None:                                                                                       #tagPop blocks its thread, the next query waits instead of stacking up
+            return
+        query, self.pending = self.pending, None
+        if query is None:
+            return
+        owner, site, key, tag = query
+        self.task = fetchEngine.call(site.tagPop, tag)
+        self.task.finished.connect(partial(self.found, query))
+        self.task.failed.connect(partial(self.done, query))
+
+    def found(self, query, tagList):
+        owner, site, key, tag = query
+        try:
+            tagsFor(key).learn(tagList[0], tagList[1])                                                                 #kept even when superseded, the next prefix may want it
+        except (TypeError, IndexError):
+            pass
+        if query is self.current and not sip.isdeleted(owner):
+            names, counts = tagsFor(key).suggest(tag)
+            self.suggested.emit(owner, names, counts)
+        self.done(query)
+
+    def done(self, query, *args):
+        self.task = None
+        if self.pending is not None and not self.timer.isActive():
+            self.lookup()
+
+    def cancel(self, owner):
+        if self.current is None or self.current[0] is not owner:
+            return
+        self.current = None
+        self.pending = None
+        self.timer.stop()
+        if self.task is not None:                                                                                       #the blocking tagPop still finishes, its answer is just never delivered
+            self.task.abort()
+            self.task = None
+
+
+mediaCache = MediaCache(os.path.join('origin', 'cache'))
+app.aboutToQuit.connect(mediaCache.flush)
+videoCache = MediaCache('video_assets', 2048*1024*1024)                                                                 #gifs and video bodies, kept across launches
+app.aboutToQuit.connect(videoCache.flush)
+motionTypes = ('.gif', '.mp4', '.avi', '.mov', '.mkv', '.webm')
+
+def cacheFor(url):
+    if os.path.splitext(Qtc.QUrl(url).path())[1].lower() in motionTypes:
+        return videoCache
+    return mediaCache
+
+
+tagDictionaries = {}
+tagDictionariesLock = threading.Lock()
+
+def tagKey(url):                                                                                                        #booru sites share a scraper class, the host tells them apart
+    return Qtc.QUrl(url).host() or "local"
+
+def tagsFor(name):                                                                                                      #one dictionary per site, loaded the first time it is asked for
+    with tagDictionariesLock:
+        if name not in tagDictionaries:
+            tagDictionaries[name] = TagDictionary(os.path.join('origin', 'tags', name + '.json'))
+        return tagDictionaries[name]
+
+def flushTags():
+    for dictionary in list(tagDictionaries.values()):
+        dictionary.flush()
+app.aboutToQuit.connect(flushTags)
+pixmapCache = PixmapCache()
+fetchEngine = FetchEngine()
+imageDecoder = ImageDecoder()
+autocomplete = AutocompleteService()
+thumbStore = ThumbnailStore(os.path.join('origin', 'thumbs'))
+os.makedirs(os.path.join('origin', 'saveImg'), exist_ok=True)
+saveCatalog = SaveCatalog(os.path.join('origin', 'saves.db'), os.path.join('origin', 'saveImg'))
+saveQueue = SaveQueue()
+gifPool = GifPool()
+playerPool = PlayerPool()
+startupMark("caches")
+
+
+
+class MainWindow(Qtw.QMainWindow):
+
+    def __init__(self):
+        super().__init__()
+
+        settings_dict = self.readSettings()
+        self.searchList = settings_dict["searchList"]
+        self.nsfw = settings_dict["NSFW"]
+        mediaCache.budget = self.cacheSize * 1024 * 1024
+        videoCache.budget = self.videoCacheSize * 1024 * 1024
+        pixmapCache.budget = self.pixmapCacheSize * 1024 * 1024
 
 
         self.monolist = self.searchList
@@ -67,14 +1331,9 @@ class MainWindow(Qtw.QMainWindow):
         self.setWindowIcon(QtGui.QIcon(os.path.join('origin', 'assets', 'pencil.png')))
         self.setGeometry(100, 100, 800, 600)
         
-        try:
-            requests.get(self.backgroundTheme)
-            is_url = True
-        except:
-            is_url = False
-
-        if is_url:
+        if self.backgroundIsUrl():                                                                                      #reachability is checked once the window is up
             self.styles["background-image"] = "background-image: url(" + str(self.backgroundTheme) + ");"
+            Qtc.QTimer.singleShot(0, self.checkBackground)
             
         elif '#' in self.backgroundTheme:
             self.styles["background-color"] =  "background-color:" + str(self.backgroundTheme) + ";"
@@ -90,15 +1349,23 @@ class MainWindow(Qtw.QMainWindow):
             self.updateStyleSheet(self.styles[k])
 
         self.showFrame("StartPage")
-       
-    def isLight(self, color):
-        hex_string = color[1:]
-        if int(hex_string, 16) > 8388607:
-            return True
-        else:
-            return False
-        
-    def reloadStyles(self):
+
+    def backgroundIsUrl(self):
+        return Qtc.QUrl(self.backgroundTheme).scheme() in ("http", "https")
+
+    def checkBackground(self):
+        task = fetchEngine.fetch(self.backgroundTheme, head=True)
+        task.failed.connect(partial(self.backgroundUnreachable, task))
+
+    def backgroundUnreachable(self, task, error):
+        if task.status is not None or task.url != self.backgroundTheme:                                                 #any http answer means the host is there, plenty refuse HEAD
+            return
+        print(error)
+        self.styles["background-image"] = ""
+        for k in self.styles:
+            self.updateStyleSheet(self.styles[k])
+
+    def readSettings(self):
         settings_file = os.path.join('origin', 'settings.json')
         with open(settings_file, 'r') as file:
             settings_dict = json.load(file)
@@ -108,9 +1375,33 @@ class MainWindow(Qtw.QMainWindow):
             self.backgroundTheme = settings_dict["backgroundTheme"]
             self.originalSizedImages = settings_dict["originalSize"]
             self.tool_tips = settings_dict["tool_tips"]
-
-        if "https://" in self.backgroundTheme:
+            self.downloadPool = settings_dict.get("downloadPool", 6)
+            self.orderedFeed = settings_dict.get("orderedFeed", True)
+            self.cacheSize = settings_dict.get("cacheSize", 1024)
+            self.videoCacheSize = settings_dict.get("videoCacheSize", 2048)
+            self.pixmapCacheSize = settings_dict.get("pixmapCacheSize", 256)
+            self.modelFeed = settings_dict.get("modelFeed", False)
+        return settings_dict
+       
+    def isLight(self, color):
+        hex_string = color[1:]
+        if int(hex_string, 16) > 8388607:
+            return True
+        else:
+            return False
+        
+    def reloadStyles(self):
+        self.readSettings()
+        mediaCache.budget = self.cacheSize * 1024 * 1024
+        videoCache.budget = self.videoCacheSize * 1024 * 1024
+        pixmapCache.budget = self.pixmapCacheSize * 1024 * 1024
+        mediaCache.evict()
+        videoCache.evict()
+        pixmapCache.evict()
+
+        if self.backgroundIsUrl():
             self.styles["background-image"] = "background-image: url(" + str(self.backgroundTheme) + ");"
+            Qtc.QTimer.singleShot(0, self.checkBackground)
             
         elif '#' in self.backgroundTheme:
             self.styles["background-color"] =  "background-color:" + str(self.backgroundTheme) + ";"
@@ -237,17 +1528,24 @@ class monolistChange(Qtc.QEvent):
 
 class SearchPage(Qtw.QFrame):
     comp = ""
+    prefetchLimit = 3                                                                                                   #page loaders allowed in flight at once
+    prefetchMargin = 1.5                                                                                                #runway wanted, in page load times
+    windowAhead = 2                                                                                                     #viewports built ahead of and behind the visible one
+    windowKeep = 4                                                                                                      #viewports before a built card collapses again
+    gifIdle = 10                                                                                                        #seconds offscreen before a gif lets go of its movie
     def __init__(self, master, url):
         super().__init__()
         self.setSizePolicy(Qtw.QSizePolicy.Policy.Expanding, Qtw.QSizePolicy.Policy.Expanding)
         
-        self.gifThread = Qtc.QThread()
-
-
-
         self.master = master
-        self.scraper = Scraper(url)
+        self.scraper = scraping().Scraper(url)
+        self.cursor = PageCursor(self.scraper, tagKey(url))
         self.vidInt = AtomicInteger()
+        self.posts = []
+        self.cards = []
+        self.liveCards = set()
+        self.bucket = self.cardBucket()
+        self.bucketDirty = False
         
                                                                                                                         #atomic integer for image loading
         self.loading = AtomicInteger()
@@ -255,21 +1553,38 @@ class SearchPage(Qtw.QFrame):
         
                                                                                                                         #making a container for the images on the page
         self.imgContain = Qtw.QWidget()
-        self.scr = Qtw.QScrollArea()
-        self.scr.setWidgetResizable(True)
-                                                                                                                        #thread for image loading
-        self.t = Qtc.QThread()
+        self.feedModel = None
+        if self.master.modelFeed:                                                                                       #one painted row per post instead of a widget tree
+            self.feedModel = FeedModel(self)
+            self.scr = FeedView(self, self.feedModel)
+        else:
+            self.scr = Qtw.QScrollArea()
+            self.scr.setWidgetResizable(True)
+                                                                                                                        #page loader, runs on the fetch engine
+        self.workers = []                                                                                               #page loaders in pid order, only the first one shows its posts
+        self.pageLatency = 2.0
+        self.pageSize = 20
+        self.scrollSpeed = 0.0
+        self.lastScroll = None
+        self.pendingRestore = set()
+        self.viewerCard = None
+        self.idleTimer = Qtc.QTimer(self)
+        self.idleTimer.setInterval(5000)
+        self.idleTimer.timeout.connect(self.releaseHiddenFrames)
+        self.idleTimer.start()
         
             
         
 
 
-        self.scr.setWidget(self.imgContain)
+        if self.feedModel is None:
+            self.scr.setWidget(self.imgContain)
 
         self.scr.verticalScrollBar().valueChanged.connect(self.checkScroll)
        
         self.vbox = AtomicClockVLayout(self.imgContain)
         self.vbox.setAlignment(Qtc.Qt.AlignmentFlag.AlignHCenter)
+        self.feedItems = self.vbox if self.feedModel is None else self.feedModel                                        #what the image viewer pages through
         
 
 
@@ -299,9 +1614,9 @@ class SearchPage(Qtw.QFrame):
         back_layout = Qtw.QHBoxLayout()
         back_layout.addWidget(back_btn)
 
-                                                                                                                        #tag search thread
-        self.bottomNavThread = Qtc.QThread()
-        self.findingTags = AtomicInteger()
+                                                                                                                        #tag suggestions
+        autocomplete.suggested.connect(self.showSuggestions)
+        self.metadataPopup = None
 
 
                                                                                                                         #Input Group
@@ -311,29 +1626,31 @@ class SearchPage(Qtw.QFrame):
         if self.master.tool_tips:
             self.tag_input.setToolTip("Search for tags here. Type as many as you want and press return on the keyboard")
 
-        grid_possible = Qtw.QGridLayout()
-        
-        
-        self.poss_widget = Qtw.QWidget()
-        self.poss_widget.setLayout(grid_possible)
+        self.suggestionModel = SuggestionModel()
+        self.suggestionView = Qtw.QListView()
+        self.suggestionView.setModel(self.suggestionModel)
+        self.suggestionView.setFlow(Qtw.QListView.Flow.LeftToRight)
+        self.suggestionView.setWrapping(True)
+        self.suggestionView.setResizeMode(Qtw.QListView.ResizeMode.Adjust)
+        self.suggestionView.setSpacing(2)
+        self.suggestionView.setEditTriggers(Qtw.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.suggestionView.clicked.connect(self.pickSuggestion)
         if self.master.tool_tips:
-            self.poss_widget.setToolTip("Tags here will be searched on when the enter button is pressed")
-
-        self.grid_scroll = Qtw.QScrollArea()
-        self.grid_scroll.setWidget(self.poss_widget)
-        
-        self.grid_scroll.setWidgetResizable(True)
+            self.suggestionView.setToolTip("Tags here will be searched on when the enter button is pressed")
+        if self.master.colorTheme:
+            text = "black" if self.isLight(self.master.colorTheme) else "white"
+            self.suggestionView.setStyleSheet(f"QListView::item {{border-radius: 6px; font-weight: bold; background-color:{self.master.colorTheme}; color: {text}}}")
+        else:
+            self.suggestionView.setStyleSheet("QListView::item {border-radius: 6px; font-weight: bold; background-color:#5C9BED;}")
        
-        # grid_scroll.setMinimumHeight(tag_input.height())
-        # grid_scroll.setMinimumWidth(tag_input.width())
-        self.grid_scroll.hide()
+        self.suggestionView.hide()
 
         input_group.addWidget(self.tag_input)
         # tag_lay.setStretch(0,3)
         # tag_lay.setStretch(1,1)
 
         
-        input_group.addWidget(self.grid_scroll)
+        input_group.addWidget(self.suggestionView)
       
 
        #change to a custom listener
@@ -344,7 +1661,7 @@ class SearchPage(Qtw.QFrame):
         
 
 
-        self.tag_input.textEdited.connect(self.tagFinderTimer)
+        self.tag_input.textEdited.connect(self.findTags)
 
 
                                                                                                                         #Enter Group
@@ -355,12 +1672,12 @@ class SearchPage(Qtw.QFrame):
         ratingCombo = Qtw.QComboBox()
         scoreCombo = Qtw.QComboBox()
 
-        if isinstance(self.scraper.site, Booru):
+        if isinstance(self.scraper.site, scraping().Booru):
             ratingCombo.setPlaceholderText("rating")
             ratingCombo.addItems(["rating", "rating:general", "rating:safe","rating:explicit", "rating:questionable"])
             scoreCombo.setPlaceholderText("score")
             scoreCombo.addItems(["score", "score:>=50", "score:>=100", "score:>=250", "score:>=500", "score:>=1000"])
-        elif isinstance(self.scraper.site, Penscrape):
+        elif isinstance(self.scraper.site, scraping().Penscrape):
             ratingCombo.setPlaceholderText("Volume")
             ratingCombo.addItems(['25', '50', '75', '100'])
             scoreCombo.setPlaceholderText("Videos")
@@ -440,103 +1757,29 @@ class SearchPage(Qtw.QFrame):
         scroll_bar.setValue(scroll_bar.value()+5)
         self.autoScrollTimer.start()
 
-    def tagFinderTimer(self):
-        self.timer = Qtc.QTimer()
-        self.timer.setInterval(1000)
-        self.timer.setSingleShot(True)
-        self.timer.timeout.connect(lambda: self.openBottomNavThread(self.tag_input))
-
-        self.timer.start()
+    def findTags(self, text):
+        autocomplete.request(self, self.scraper.site, self.cursor.tagKey, text.split(' ')[-1])
 
+    def showSuggestions(self, owner, names, counts):
+        if owner is not self:
+            return
+        self.suggestionModel.setSuggestions(names, counts)
+        self.suggestionView.setMaximumHeight(self.tag_input.height()*3)
+        self.suggestionView.setMaximumWidth(self.tag_input.width())
+        self.suggestionView.setVisible(bool(names))
 
-    @Qtc.pyqtSlot(bool, name="hideShow")
-    def gridScrollVisibility(self, bool):
-        if bool:
-            self.grid_scroll.show()
-        else:
-            self.grid_scroll.hide()
+    def pickSuggestion(self, index):
+        self.insertText(self.tag_input, self.suggestionModel.names[index.row()], self.suggestionView)
 
     def switchBack(self):
         self.blockSignals(True)
         self.loading.set(1)
-        self.findingTags.set(1)
-        self.worker.stop = True
-        self.t.quit()
-        self.bottomNavThread.quit()
-        self.t.wait()
-        self.bottomNavThread.wait()
+        self.cancelPages()
+        autocomplete.cancel(self)
         self.mainLayout.deleteLater()                                                                                   #self layout delete later + back button functionality
         self.master.showFrame("StartPage")
         
 
-    def openBottomNavThread(self, tag_input):
-        if self.bottomNavThread.isRunning():
-            self.findingTags.set(1)
-            self.bottomNavThread.quit()
-            self.bottomNavThread.wait()
-
-        self.bottomNavThread = Qtc.QThread()
-        bwork = BottomWorker(self.scraper)
-        bwork.progress.connect(self.bottomNavWork)
-        bwork.show.connect(self.gridScrollVisibility)
-        bwork.finished.connect(self.bottomNavThread.quit)
-        bwork.finished.connect(bwork.deleteLater)
-        bwork.moveToThread(self.bottomNavThread)
-
-        self.bottomNavThread.started.connect(partial(bwork.run, self.findingTags, tag_input.text().split(' ')))
-
-        self.findingTags.set(0)
-        self.bottomNavThread.start()
-
-    @Qtc.pyqtSlot(list, list,  name="bottom")
-    def bottomNavWork(self, names, counts):
-        self.grid_scroll.setMaximumHeight(self.tag_input.height()*3)
-        self.grid_scroll.setMaximumWidth(self.tag_input.width())
-
-        grid = Qtw.QGridLayout()
-        col = 0
-        row = 0
-        colCount = 2
-        for i in range(len(names)):
-            j=i
-            h_rows = Qtw.QHBoxLayout()
-            name_btn = Qtw.QPushButton(text=names[i])
-            name_btn.clicked.connect(partial(self.insertText, self.tag_input, names[i], self.grid_scroll))
-            if self.master.colorTheme:
-                if self.isLight(self.master.colorTheme):
-                    name_btn.setStyleSheet(f"border-radius: 40%;font-weight: bold; background-color:{self.master.colorTheme}; color: black")
-                else:
-                    name_btn.setStyleSheet(f"border-radius: 40%;font-weight: bold; background-color:{self.master.colorTheme}; color: white")
-
-            else:
-                name_btn.setStyleSheet(f"border-radius: 40%;font-weight: bold; background-color:#5C9BED;")
-
-            h_rows.addWidget(name_btn)
-            if j < len(counts):
-                count_label = Qtw.QLabel(text=str(counts[j]))
-                if self.master.colorTheme:
-                    reverse = self.reverseColor(self.master.colorTheme)
-                    if self.isLight(reverse):
-                        count_label.setStyleSheet(f"background-color:{reverse}; color: black;font-weight: bold;")
-                    else:
-                        count_label.setStyleSheet(f"background-color:{reverse}; color: white;font-weight: bold;")
-
-                else:
-                    count_label.setStyleSheet(f"background-color:#5CEDE3;font-weight: bold;")
-
-                h_rows.addWidget(count_label)
-
-            grid.addLayout(h_rows, row, col)
-            col+=1
-            if col >= colCount:
-                col = 0
-                row+=1
-
-        self.poss_widget = Qtw.QWidget()
-        self.grid_scroll.setWidget(self.poss_widget)
-        self.poss_widget.setLayout(grid)
-
-          
     def isLight(self, color):
         hex_string = color[1:]
         if int(hex_string, 16) > 8388607:
@@ -586,10 +1829,7 @@ class SearchPage(Qtw.QFrame):
 
     def clearWidget(self):
       
-        if self.t and self.t.isRunning():
-            self.worker.stop = True
-            self.t.quit()
-            self.t.wait()
+        self.cancelPages()
 
         self.loading.set(1)
         i = self.vbox.atom_count.get()
@@ -607,6 +1847,13 @@ class SearchPage(Qtw.QFrame):
             i-=1
         self.vbox.atom_count.set(0)
         self.imageIndex = 0
+        self.posts = []
+        self.cards = []
+        self.liveCards = set()
+        self.pendingRestore = set()
+        if self.feedModel is not None:
+            self.scr.dropEditor()
+            self.feedModel.clear()
             
         
         # self.vbox.setParent(None)
@@ -662,16 +1909,45 @@ class SearchPage(Qtw.QFrame):
         # self.restructureGrid(grid)
     
     def checkScroll(self):
+        self.updateVirtualWindow()
+        self.updateVisibility()
+        if self.bucketDirty:
+            self.redecodeVisible()
         scroll_bar = self.scr.verticalScrollBar()
-        if scroll_bar.value() > scroll_bar.maximum() * 0.95 and not self.t.isRunning():
-            with self.scraper.lock:
-                self.scraper.site.pid+=1                                                                                                                     #scraper pid
-                self.loadThread()
+        self.trackScroll(scroll_bar.value())
+        if scroll_bar.value() > scroll_bar.maximum() * 0.95 and not self.workers:
+            self.loadThread()
+        else:
+            self.prefetch()
+
+    def trackScroll(self, value):
+        now = time.monotonic()
+        if self.lastScroll is not None:
+            dt = now - self.lastScroll[0]
+            if dt > 1.0:                                                                                                #a pause, start the estimate over
+                self.scrollSpeed = 0.0
+            elif dt > 0:
+                self.scrollSpeed = 0.7*self.scrollSpeed + 0.3*max(0.0, (value - self.lastScroll[1]) / dt)
+        self.lastScroll = (now, value)
+
+    def prefetch(self):                                                                                                 #keep enough pages coming that the bottom is never reached before they land
+        if self.cursor.exhausted or self.scrollSpeed <= 0 or self.loading.get() == 1 and not self.workers:
+            return
+        scroll_bar = self.scr.verticalScrollBar()
+        now = time.monotonic()
+        pageTime = self.cardPitch() * self.pageSize / self.scrollSpeed
+        runway = (scroll_bar.maximum() - scroll_bar.value()) / self.scrollSpeed
+        for worker in self.workers:                                                                                     #a loading page adds its length once it lands
+            runway = max(runway, worker.startedAt + self.pageLatency - now) + pageTime
+        while runway < self.pageLatency * self.prefetchMargin and len(self.workers) < self.prefetchLimit:
+            self.startPage()
+            runway += pageTime
 
     def whatToPullCustom(self, url, tags):
-        scap = Scraper(url, tags=tags)
+        scap = scraping().Scraper(url, tags=tags)
         print("::url" + url + tags + "\n")
         self.scraper = scap
+        self.cursor = PageCursor(scap, tagKey(url))
         
 
         self.clearWidget()
@@ -706,80 +1982,17 @@ class SearchPage(Qtw.QFrame):
                         self.autoScrollTimer.start()
 
         return super().eventFilter(source, event)
-    def imageCombos(self, posts):
-        
-        comboBox = Qtw.QComboBox()   
-        comboBox.setInsertPolicy(Qtw.QComboBox.InsertPolicy.NoInsert)
-        listWidget = Qtw.QListWidget()
-        comboBox.setModel(listWidget.model())
-        comboBox.setView(listWidget)
-       
-
-        for key in posts:
-            if key == "score" or key == "rating" :
-                item = Qtw.QListWidgetItem(listWidget)
-                widget = Qtw.QWidget()
-                vbox = Qtw.QVBoxLayout()
-                label = Qtw.QLabel(text=key)
-                pbtn = Qtw.QPushButton(text=str(posts[key]))
-                if key == "score":
-                    pbtn.clicked.connect(partial(self.whatToPullCustom, self.comp, "score:" + str(posts[key])))
-
-                elif key == "rating":
-                    pbtn.clicked.connect(partial(self.whatToPullCustom, self.comp, "rating:" + str(posts[key])))
-
-                vbox.addWidget(label)
-                vbox.addWidget(pbtn)
-                vbox.setContentsMargins(0,0,0,0)
-                widget.setLayout(vbox)
-
-                item.setSizeHint(widget.sizeHint())
-                listWidget.addItem(item)
-                listWidget.setItemWidget(item, widget)                      #Using ListWidget for custom combobox
-            elif key == 'tags':
-                tags = posts[key].strip().split(' ')
-                row = 0
-                col = 0
-                colCount = 3
-
-                widget = Qtw.QWidget()
-                vbox = Qtw.QVBoxLayout()
-                grid = Qtw.QGridLayout()
-                grid.setContentsMargins(0,0,0,0)
-                item = Qtw.QListWidgetItem(listWidget)
-
-                for tag in tags:
-                    
-                    pbtn = Qtw.QPushButton(text=tag)
-                    pbtn.clicked.connect(partial(self.whatToPullCustom, self.comp, tag))
-                    pbtn.clicked.connect(partial(self.insertText, self.tag_input, tag, self.grid_scroll))
-                    grid.addWidget(pbtn, row, col)
-                    col+=1
-                    if col >= colCount:
-                        col=0
-                        row+=1
-                   
-
-                label = Qtw.QLabel(text="tags")
-                vbox.addWidget(label)
-                vbox.addLayout(grid)
-                widget.setLayout(vbox)
-
-                item.setSizeHint(widget.sizeHint())
-                listWidget.addItem(item)
-                listWidget.setItemWidget(item, widget)
-
-                    
-                
-
-        
-        return comboBox
+    def showMetadata(self, combo):
+        if self.metadataPopup is None:
+            self.metadataPopup = MetadataPopup(self)
+        self.metadataPopup.showFor(combo)
     # def autoScroll(self):                                                                                                                              #why is this here?
     #     self.scroll
     def whatToPull(self, url):
         self.comp = url
-        scap = Scraper(url, tags="")
+        scap = scraping().Scraper(url, tags="")
         self.scraper = scap
+        self.cursor = PageCursor(scap, tagKey(url))
         
 
         with self.scraper.lock:
@@ -789,74 +2002,118 @@ class SearchPage(Qtw.QFrame):
     def loadThread(self):
         if self.loading.get() == 0:
             self.loading.set(1)
-            self.worker = Worker(self.comp, self.scraper)
-            self.worker.progress.connect(self.addImageToLayout)
-            self.worker.finished.connect(self.t.quit)
-            self.worker.finished.connect(self.worker.deleteLater)
-
-            self.worker.moveToThread(self.t)
-
-            self.t.started.connect(self.worker.run)
-            self.t.start()
+            self.startPage()
+
+    def startPage(self):
+        worker = Worker(self.comp, self.cursor, self.cursor.claim(), self.master.downloadPool, self.master.orderedFeed, self.bucket)
+        worker.held = len(self.workers) > 0
+        worker.progress.connect(self.addImageToLayout)
+        worker.refined.connect(self.refineImage)
+        worker.finished.connect(partial(self.pageFinished, worker))
+        self.workers.append(worker)
+        worker.run()
+
+    def pageFinished(self, worker):
+        if worker not in self.workers:
+            return
+        if worker.scrapeError:                                                                                          #a timeout says nothing about the end of the results
+            self.cursor.giveBack(worker.pid)
+        elif not worker.stop:
+            self.pageLatency = 0.7*self.pageLatency + 0.3*(time.monotonic() - worker.startedAt)
+            if worker.L:
+                self.pageSize = len(worker.L)
+            else:
+                self.cursor.exhausted = True
+        while self.workers and not self.workers[0].isRunning():                                                         #pages show in order, a finished head hands over to the next
+            self.workers.pop(0)
+            if self.workers:
+                self.workers[0].releaseHeld()
+        if not self.workers:
+            self.loading.set(0)
 
-    @Qtc.pyqtSlot(bytes, dict, list, bool, name="imageLoad")
-    def addImageToLayout(self, data, json, vidFlag, gifFlag):
-        
-        widget = Qtw.QWidget()
+    def cancelPages(self):
+        workers = self.workers
+        self.workers = []
+        for worker in workers:
+            worker.cancel()
+
+    @Qtc.pyqtSlot(object, name="imageLoad")
+    def addImageToLayout(self, post):
+        if self.feedModel is not None:
+            self.posts.append(post)
+            self.feedModel.appendPost(post)
+            self.vbox.atom_count.increment()
+            self.imageIndex += 1
+            self.loading.set(0)
+            self.refineImage(post)
+            return
+        widget = FeedCard(self, post, self.imageIndex)
         widget.setFixedWidth(int(self.master.width()*0.7))
         widget.setFixedHeight(int(self.master.height()*0.9))
+        widget.setSizePolicy(Qtw.QSizePolicy.Policy.Expanding, Qtw.QSizePolicy.Policy.Expanding)
+        self.vbox.addWidget(widget, stretch=10, alignment=Qtc.Qt.AlignmentFlag.AlignCenter)
+        self.posts.append(post)
+        self.cards.append(widget)
         
-        
+        self.vbox.atom_count.increment()
+        print(self.vbox.atom_count.get())
+        self.imageIndex += 1
+        self.loading.set(0)
+
+        self.updateVirtualWindow()
+        Qtc.QTimer.singleShot(0, self.updateVisibility)                                                                 #after the layout has placed the new card
+        if not widget.isLive() and post.complete and post.image is not None:                                           #born offscreen, park the decode in the cache
+            pixmapCache.put(post.url, post.bucket, QtGui.QPixmap.fromImage(post.image))
+            post.image = None
+
+    def buildCard(self, card, widget):
+        post = card.post
+        json = post.json
+        vidFlag = post.vidFlag
+        gifFlag = post.gifFlag
 
         inner_card_layout = Qtw.QVBoxLayout()
         inner_card_layout.setSpacing(0)
         
-        label = ClickableLabels(self.imageIndex, self.vbox)
+        label = ClickableLabels(card.index, self.feedItems)
         label.setScaledContents(True)
+        label.post = post
         if self.master.tool_tips:
             label.setToolTip("Double Click for Image Viewer")
         label.clicked.connect(self.imageViewer.initalizeView)
         
 
-        heart_icon = QtGui.QIcon('origin/assets/loveheart_empty.png')
+        if post.saved:
+            heart_icon = QtGui.QIcon('origin/assets/red-heart-icon.png')
+        else:
+            heart_icon = QtGui.QIcon('origin/assets/loveheart_empty.png')
         save_btn = ButtonWithState()
+        save_btn.state = post.saved
         save_btn.setIcon(heart_icon)
           
-        save_btn.clicked.connect(partial(self.save_feature, json, save_btn))
+        save_btn.clicked.connect(partial(self.save_feature, json, save_btn, post))
+        save_btn.clicked.connect(lambda: setattr(post, 'saved', save_btn.state))                                        #the button goes away when the card collapses
     
       
         if gifFlag:                                                                                                                                     #gif worker
             
             
-            gif_worker = GifWorker(label, json)
-            
-            gif_worker.handle_gif.connect(self.makeMovie_handleGif)
-            gif_worker.finished.connect(self.gifThread.quit)
-            gif_worker.finished.connect(gif_worker.deleteLater)
-
-            gif_worker.moveToThread(self.gifThread)
-            
-
-
-            self.gifThread.started.connect(gif_worker.run)
-
-            self.gifThread.start()
+            card.gifLabel = label
+            gifPool.load(label, json, self.makeMovie_handleGif)
 
 
             
             
             
             inner_card_layout.addWidget(label)
-            label.setMinimumSize(int(widget.width()*0.9), int(widget.height()*0.9))
+            label.setMinimumSize(int(card.width()*0.9), int(card.height()*0.9))
 
             combos_saves_horizontal = Qtw.QHBoxLayout()
             spacer = Qtw.QSpacerItem(20,20, Qtw.QSizePolicy.Policy.Expanding, Qtw.QSizePolicy.Policy.Minimum)
-            combo = self.imageCombos(json)
+            combo = MetadataCombo(self, json)
             combos_saves_horizontal.addWidget(combo)
             combos_saves_horizontal.addSpacerItem(spacer)
             combos_saves_horizontal.addWidget(save_btn)
-        
-            combo.installEventFilter(self.createEventFilter(combo, combos_saves_horizontal))
 
 
             combos_saves_horizontal.setStretch(0, 5)
@@ -866,125 +2123,38 @@ class SearchPage(Qtw.QFrame):
 
         elif vidFlag[0]:
 
-            container = videoContainer(json)
-            simpleLayout = Qtw.QVBoxLayout()
-            is_stacked = False
-            if vidFlag[1]:
-                stacked = Qtw.QStackedLayout()
-                preview_image = QtGui.QImage()
-                preview_image.loadFromData(vidFlag[1])
-                preview_pixmap = QtGui.QPixmap.fromImage(preview_image)
-                preview_pixmap_scaled = preview_pixmap.scaled(preview_image.width(), preview_image.height(), aspectRatioMode=Qtc.Qt.AspectRatioMode.KeepAspectRatio, transformMode=Qtc.Qt.TransformationMode.SmoothTransformation)
-                preview_label = Qtw.QLabel()
-                preview_label.setScaledContents(True)
-                preview_label.setPixmap(preview_pixmap_scaled)
-                video = QVideoWidget()
-                stacked.addWidget(preview_label)
-                stacked.addWidget(video)
-                video.setContentsMargins(0,0,0,0)
-                preview_label.setContentsMargins(0,0,0,0)
-                stacked.setContentsMargins(0,0,0,0)
-                is_stacked = True
-            else:
-                video = QVideoWidget()
-
-            audio = Qtmedia.QAudioOutput()
-            audio.setVolume(0.5)
-            audioDevice = Qtmedia.QMediaDevices.defaultAudioOutput()
-            audio.setDevice(audioDevice)
-            volIcon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.AudioVolumeMedium)
-            volumeBtn = Qtw.QPushButton(icon=volIcon)
-            #set video sink?
-            audio_slider = Qtw.QSlider(video, orientation=Qtc.Qt.Orientation.Vertical)
-            audio_slider.setStyleSheet("QSlider {bottom:0;} QSlider::handle:horizontal {margin: 0; height:30px; width:10px; background-color:grey;}  QSlider::grove:horizontal: {height:30px; background-color: blue; border: 1px solid #bbb;}")
-            audio_slider.setRange(0,100)
-            audio_slider.valueChanged.connect(lambda value: audio.setVolume(value/100))
-            audio_slider.setValue(50)
-            audio_slider.hide()
-            volumeBtn.clicked.connect(lambda: self.sliderShow_audio(audio_slider))
-
-            video_slider = Qtw.QSlider()
-           
-            video_slider.setStyleSheet("QSlider::handle:horizontal {margin: 0; height:10px; width:10px; background-color:grey;}  QSlider::grove:horizontal: {height:10px; background-color: blue; border: 1px solid #bbb;}")
-            # video_slider.setFixedWidth()
-            video_slider.setRange(0,100)
-            
-            
-
-            player = Qtmedia.QMediaPlayer()
-            # video.videoFrameChanged.connect(lambda: self.handle_video(video.videoFrame(), label))
-            player.setVideoOutput(video)
-            player.setAudioOutput(audio)
-            player.setPlaybackRate(1.0)
-
-            play_icon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackStart)
-            play_btn = Qtw.QPushButton(icon=play_icon)
+            container = videoContainer(json, self, save_btn)                                                            #no player until play is pressed
+            card.video = container
+            if self.master.tool_tips and post.mediaSize:
+                container.setToolTip("{} video, {:.1f} MB, loads when played".format(post.mediaType or "Unknown", post.mediaSize / (1024*1024)))
             if self.master.tool_tips:
-                play_btn.setToolTip("Play video")
-            if is_stacked:
-                play_btn.clicked.connect(partial(self.handle_video_stack, player, play_btn, json, stacked))
-            else:
-                play_btn.clicked.connect(partial(self.handle_video, player, play_btn, json))
-
-
-            
-            video_slider.valueChanged.connect(lambda value: player.setPosition(int(player.duration()*value/100)))
-            video_slider.setOrientation(Qtc.Qt.Orientation.Horizontal)
-
-            h_box = Qtw.QHBoxLayout()
-            h_box.addWidget(play_btn)
-            h_box.addWidget(video_slider)
-            h_box.addWidget(volumeBtn)
-            h_box.addWidget(save_btn)
-            h_box.setStretch(0, 1)
-            h_box.setStretch(1, 8)
-            h_box.setStretch(2, 1)
-            h_box.setStretch(3, 1)
-            
-            
-            
-           
-            # h_box.setStretch(0, 4)
-            # h_box.setStretch(1,2)
-            
-
-            player.positionChanged.connect(partial(self.videoTimerStart, video_slider, player))
-            
-            
-            
-           
-            
-            
-            
-            if is_stacked:
-                simpleLayout.addLayout(stacked)
+                container.play_btn.setToolTip("Play video")
+            if vidFlag[1] is None and 'preview_url' in json:
+                vidFlag[1] = pixmapCache.get(json['preview_url'], post.bucket)
+            post.previewLabel = container.preview_label
+            if vidFlag[1] is None:                                                                                      #placeholder until the preview lands
+                container.preview_label.setAlignment(Qtc.Qt.AlignmentFlag.AlignCenter)
+                if 'preview_url' in json:
+                    container.preview_label.setText("Loading preview")
+                    self.loadPreview(post)
             else:
-                simpleLayout.addWidget(video)
-            simpleLayout.addLayout(h_box)
-            simpleLayout.setStretch(0,10)
-            simpleLayout.setStretch(1,2)
+                self.refineImage(post)
 
-            container.setLayout(simpleLayout)
             inner_card_layout.addWidget(container)
-            inner_card_layout.addWidget(self.imageCombos(json))
+            inner_card_layout.addWidget(MetadataCombo(self, json))
 
             
         else:    
-            img = QtGui.QImage()
-            img.loadFromData(data)
-            pixmap = QtGui.QPixmap.fromImage(img)
-            scaled_pixmap = pixmap.scaled(img.width(), img.height(), aspectRatioMode=Qtc.Qt.AspectRatioMode.KeepAspectRatio, transformMode=Qtc.Qt.TransformationMode.SmoothTransformation)
-            label.setPixmap(scaled_pixmap)
+            post.label = label
+            self.refineImage(post)
             inner_card_layout.addWidget(label)
 
             combos_saves_horizontal = Qtw.QHBoxLayout()
             spacer = Qtw.QSpacerItem(20,20, Qtw.QSizePolicy.Policy.Expanding, Qtw.QSizePolicy.Policy.Minimum)
-            combo = self.imageCombos(json)
+            combo = MetadataCombo(self, json)
             combos_saves_horizontal.addWidget(combo)
             combos_saves_horizontal.addSpacerItem(spacer)
             combos_saves_horizontal.addWidget(save_btn)
-        
-            combo.installEventFilter(self.createEventFilter(combo, combos_saves_horizontal))
 
 
             combos_saves_horizontal.setStretch(0, 5)
@@ -996,92 +2166,242 @@ class SearchPage(Qtw.QFrame):
 
 
         widget.setLayout(inner_card_layout)
-        widget.setSizePolicy(Qtw.QSizePolicy.Policy.Expanding, Qtw.QSizePolicy.Policy.Expanding)
-        self.vbox.addWidget(widget, stretch=10, alignment=Qtc.Qt.AlignmentFlag.AlignCenter)
-        
-        self.vbox.atom_count.increment()
-        print(self.vbox.atom_count.get())
-        self.imageIndex += 1
-        self.loading.set(0)
+
+    @Qtc.pyqtSlot(object)
+    def refineImage(self, post):
+        if post.vidFlag[0]:                                                                                             #a preview that landed after its card
+            preview = post.vidFlag[1]
+            if isinstance(preview, QtGui.QImage):
+                preview = QtGui.QPixmap.fromImage(preview)
+                pixmapCache.put(post.json['preview_url'], post.bucket or self.bucket, preview)
+                post.vidFlag[1] = preview
+            label = post.previewLabel
+            if preview is not None and label is not None and not sip.isdeleted(label):
+                label.setPixmap(preview)
+            if self.feedModel is not None:
+                self.parkPost(post)
+            self.feedChanged(post)
+            return
+        if post.label is None or sip.isdeleted(post.label):
+            if post.complete and post.image is not None:
+                pixmapCache.put(post.url, post.bucket, QtGui.QPixmap.fromImage(post.image))
+                post.image = None
+            if self.feedModel is not None:
+                self.parkPost(post)
+            self.feedChanged(post)
+            return
+        if post.image is None and post.pixmap is None and post.complete:                                                #restored card, pick the decode back up at today's size
+            decodedAt = post.bucket                                                                                     #collapsed cards are never redecoded, the size they had is checked here
+            post.bucket = self.bucket
+            post.pixmap = pixmapCache.get(post.url, post.bucket)
+            stale = None
+            if post.pixmap is None and decodedAt is not None and decodedAt != self.bucket:
+                stale = pixmapCache.get(post.url, decodedAt)
+                if stale is not None and stale.width() < decodedAt.width() and stale.height() < decodedAt.height():    #native size, a bigger bucket changes nothing
+                    post.pixmap = stale
+                    pixmapCache.put(post.url, self.bucket, stale)
+                    stale = None
+            if stale is not None:                                                                                       #the old size stands in until the sharper decode lands
+                post.label.setPixmap(stale)
+            if post.pixmap is None:
+                data = self.postData(post)
+                if data is None:
+                    task = fetchEngine.fetch(post.url)
+                    task.finished.connect(partial(self.restoreDecode, post))
+                else:
+                    self.restoreDecode(post, data)
+                return
+        if post.image is not None:
+            post.pixmap = QtGui.QPixmap.fromImage(post.image)
+            if post.complete and post.bucket is not None:
+                pixmapCache.put(post.url, post.bucket, post.pixmap)
+                post.image = None                                                                                       #the pixmap is all the card needs from here on
+        if post.pixmap is not None:
+            post.label.setPixmap(post.pixmap)
+
+    def loadPreview(self, post):
+        if post.previewTask is not None:
+            return
+        post.previewTask = fetchEngine.fetch(post.json['preview_url'])
+        post.previewTask.finished.connect(lambda data: self.decodePreview(post, data))
+        post.previewTask.failed.connect(lambda error: setattr(post, 'previewTask', None))
+
+    def decodePreview(self, post, data):
+        target = post.bucket or self.bucket
+        post.previewTask = imageDecoder.decode(data, target)
+        post.previewTask.finished.connect(lambda image: self.previewDecoded(post, target, image))
+        post.previewTask.failed.connect(lambda error: setattr(post, 'previewTask', None))
+
+    def previewDecoded(self, post, target, image):
+        post.previewTask = None
+        self.pendingRestore.discard(post)
+        if image.isNull():
+            return
+        pixmap = QtGui.QPixmap.fromImage(image)
+        pixmapCache.put(post.json['preview_url'], target, pixmap)
+        if self.feedModel is None:                                                                                      #rows read previews back from the cache
+            post.vidFlag[1] = pixmap
+        self.refineImage(post)
+
+    def feedChanged(self, post):
+        if self.feedModel is not None:
+            self.feedModel.postChanged(post)
+
+    def parkPost(self, post):                                                                                           #a row keeps nothing but its json, pixmaps live in the cache and bytes in the media cache
+        preview = post.vidFlag[1]
+        if preview is not None and 'preview_url' in post.json:
+            if isinstance(preview, QtGui.QImage):
+                preview = QtGui.QPixmap.fromImage(preview)
+            pixmapCache.put(post.json['preview_url'], post.bucket or self.bucket, preview)
+            post.vidFlag[1] = None
+        if not post.complete or post.bucket is None:
+            return
+        if post.image is not None:
+            pixmapCache.put(post.url, post.bucket, QtGui.QPixmap.fromImage(post.image))
+        elif post.pixmap is not None and pixmapCache.get(post.url, post.bucket) is None:
+            pixmapCache.put(post.url, post.bucket, post.pixmap)
+        post.image = None
+        post.pixmap = None
+        post.data = None
+
+    def postPixmap(self, post):                                                                                         #what a painted row shows, asks for a decode on a miss
+        url = post.url
+        self.parkPost(post)
+        if post.vidFlag[0] or post.gifFlag:
+            if 'preview_url' not in post.json:
+                return None
+            url = post.json['preview_url']
+        pixmap = pixmapCache.get(url, self.bucket)
+        if pixmap is None and post.bucket is not None:
+            pixmap = pixmapCache.get(url, post.bucket)
+        if pixmap is None or post.bucket != self.bucket:
+            self.requestPixmap(post, url)
+        return pixmap
+
+    def requestPixmap(self, post, url):
+        if post in self.pendingRestore or (url == post.url and not post.complete):
+            return
+        self.pendingRestore.add(post)
+        post.bucket = self.bucket
+        if url != post.url:
+            self.loadPreview(post)
+            return
+        data = self.postData(post)
+        if data is None:
+            task = fetchEngine.fetch(post.url)
+            task.finished.connect(partial(self.restoreDecode, post))
+            task.failed.connect(lambda error: self.pendingRestore.discard(post))
+        else:
+            self.restoreDecode(post, data)
+
+    def detachedCard(self, row):                                                                                        #the viewer copies from a real card, build one off the view
+        if self.viewerCard is not None and self.viewerCard.index == row:
+            return self.viewerCard
+        if self.viewerCard is not None:
+            self.viewerCard.collapse()
+            self.viewerCard.deleteLater()
+        self.viewerCard = FeedCard(self, self.posts[row], row)
+        self.viewerCard.setFixedSize(int(self.master.width()*0.7), int(self.master.height()*0.9))
+        self.viewerCard.populate()
+        return self.viewerCard
+
+    def cardPitch(self):
+        return int(self.master.height()*0.9) + max(0, self.vbox.spacing())
+
+    def updateVirtualWindow(self):                                                                                      #cards near the viewport get their widgets, the rest stay placeholders
+        if not self.cards:
+            return
+        pitch = max(1, self.cardPitch())
+        top = self.scr.verticalScrollBar().value() - self.vbox.contentsMargins().top()
+        height = self.scr.viewport().height()
+        first = max(0, (top - self.windowAhead*height) // pitch)
+        last = min(len(self.cards) - 1, (top + height + self.windowAhead*height) // pitch)
+        keepFirst = (top - self.windowKeep*height) // pitch
+        keepLast = (top + height + self.windowKeep*height) // pitch
+        for card in list(self.liveCards):
+            if card.index < keepFirst or card.index > keepLast:
+                card.collapse()
+        for i in range(first, last + 1):
+            self.cards[i].populate()
+
+    def postData(self, post):
+        if post.data is not None:
+            return post.data
+        return cacheFor(post.url).get(post.url)
+
+    def cardBucket(self):
+        ratio = self.devicePixelRatioF()
+        return sizeBucket(self.master.width()*0.7*ratio, self.master.height()*0.9*ratio)
+
+    def redecodeVisible(self):
+        viewport = self.scr.viewport()
+        visible = Qtc.QRect(0, self.scr.verticalScrollBar().value(), viewport.width(), viewport.height())
+        stale = False
+        for post in self.posts:
+            if post.pixmap is None or not post.complete or post.bucket is None or post.bucket == self.bucket:
+                continue
+            if post.pixmap.width() < post.bucket.width() and post.pixmap.height() < post.bucket.height():             #already at native size, a bigger bucket changes nothing
+                post.bucket = self.bucket
+                pixmapCache.put(post.url, self.bucket, post.pixmap)
+                continue
+            if post.label is None or sip.isdeleted(post.label):
+                continue
+            if not post.label.parentWidget().parentWidget().geometry().intersects(visible):
+                stale = True
+                continue
+            post.bucket = self.bucket
+            cached = pixmapCache.get(post.url, self.bucket)
+            if cached is not None:
+                post.pixmap = cached
+                self.refineImage(post)
+                continue
+            data = self.postData(post)
+            if data is None:
+                continue
+            task = imageDecoder.decode(data, self.bucket)
+            task.finished.connect(partial(self.redecoded, post))
+        self.bucketDirty = stale
+
+    def restoreDecode(self, post, data):
+        task = imageDecoder.decode(data, post.bucket)
+        task.finished.connect(partial(self.redecoded, post))
+
+    def redecoded(self, post, image):
+        self.pendingRestore.discard(post)
+        if not image.isNull():
+            post.image = image
+            self.refineImage(post)
+
+    def setDecoded(self, label, image):
+        if not sip.isdeleted(label) and not image.isNull():
+            label.setPixmap(QtGui.QPixmap.fromImage(image))
+
+    def viewerDecoded(self, label, url, target, image):
+        if image.isNull():
+            return
+        pixmap = QtGui.QPixmap.fromImage(image)
+        pixmapCache.put(url, target, pixmap)
+        if not sip.isdeleted(label):
+            label.setPixmap(pixmap)
 
 
    
     def copyVid(self, current_vid):
-            container = Qtw.QWidget()
-            simpleLayout = Qtw.QVBoxLayout()
-            video = QVideoWidget()
-            audio = Qtmedia.QAudioOutput()
-            audio.setVolume(0.5)
-            audioDevice = Qtmedia.QMediaDevices.defaultAudioOutput()
-            audio.setDevice(audioDevice)
-            volIcon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.AudioVolumeMedium)
-            volumeBtn = Qtw.QPushButton(icon=volIcon)
-            #set video sink?
-            audio_slider = Qtw.QSlider(video, orientation=Qtc.Qt.Orientation.Vertical)
-            audio_slider.setStyleSheet("QSlider {bottom:0;} QSlider::handle:horizontal {margin: 0; height:30px; width:10px; background-color:grey;}  QSlider::grove:horizontal: {height:30px; background-color: blue; border: 1px solid #bbb;}")
-            audio_slider.setRange(0,100)
-            audio_slider.valueChanged.connect(lambda value: audio.setVolume(value/100))
-            audio_slider.setValue(50)
-            audio_slider.hide()
-            volumeBtn.clicked.connect(lambda: self.sliderShow_audio(audio_slider))
-
-            video_slider = Qtw.QSlider()
-           
-            video_slider.setStyleSheet("QSlider::handle:horizontal {margin: 0; height:10px; width:10px; background-color:grey;}  QSlider::grove:horizontal: {height:10px; background-color: blue; border: 1px solid #bbb;}")
-            # video_slider.setFixedWidth()
-            video_slider.setRange(0,100)
-            
-            
-
-            player = Qtmedia.QMediaPlayer()
-            player.setVideoOutput(video)
-            player.setAudioOutput(audio)
-
-            play_icon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackStart)
-            play_btn = Qtw.QPushButton(icon=play_icon)
-            play_btn.clicked.connect(partial(self.handle_video, player, play_btn, current_vid.json))
-
             heart_icon = QtGui.QIcon('origin/assets/loveheart_empty.png')
             save_btn = ButtonWithState()
+            save_btn.state = int(saveCatalog.has(current_vid.json.get('file_url')))
+            if save_btn.state:
+                heart_icon = QtGui.QIcon('origin/assets/red-heart-icon.png')
             save_btn.setIcon(heart_icon)
           
             save_btn.clicked.connect(partial(self.save_feature, current_vid.json, save_btn))
-            
-
-            h_box = Qtw.QHBoxLayout()
-            h_box.addWidget(play_btn)
-            h_box.addWidget(video_slider)
-            h_box.addWidget(volumeBtn)
-            h_box.addWidget(save_btn)
-            h_box.setStretch(0, 1)
-            h_box.setStretch(1, 8)
-            h_box.setStretch(2, 1)
-            h_box.setStretch(3, 1)
-            
-            
-            
-           
-            # h_box.setStretch(0, 4)
-            # h_box.setStretch(1,2)
-            
-
-            player.positionChanged.connect(partial(self.videoTimerStart, video_slider, player))
-
-            video_slider.valueChanged.connect(lambda value: player.setPosition(int(player.duration()*value/100)))
-            video_slider.setOrientation(Qtc.Qt.Orientation.Horizontal)
-            
-            
-           
-            
-            
-            
-
-            simpleLayout.addWidget(video)
-            simpleLayout.addLayout(h_box)
-            simpleLayout.setStretch(0,5)
-            simpleLayout.setStretch(1,5)
 
-            container.setLayout(simpleLayout)
+            container = videoContainer(current_vid.json, self, save_btn)
+            preview = current_vid.preview_label.pixmap()
+            if preview is not None and not preview.isNull():
+                container.preview_label.setPixmap(preview)
+            container.layout().setStretch(0,5)
+            container.layout().setStretch(1,5)
             return container
     def copyMovie(self, current_movie):
         new_movie = Qtw.QLabel()
@@ -1092,31 +2412,22 @@ class SearchPage(Qtw.QFrame):
         new_img = Qtw.QLabel()
         new_img.setScaledContents(True)
         new_img.setPixmap(current_img.pixmap())
+        post = getattr(current_img, 'post', None)
+        if post is not None and post.complete and post.bucket is not None:                                              #card pixmaps are card sized, the viewer gets its own decode
+            if self.imageViewer.imageHandlingFlag:
+                target = None
+            else:
+                ratio = self.devicePixelRatioF()
+                target = sizeBucket(self.imageViewer.width()*ratio, self.imageViewer.height()*ratio)
+            if target is None or target.width() > post.bucket.width() or target.height() > post.bucket.height():
+                cached = pixmapCache.get(post.url, target)
+                data = None if cached is not None else self.postData(post)
+                if cached is not None:
+                    new_img.setPixmap(cached)
+                elif data is not None:
+                    task = imageDecoder.decode(data, target)
+                    task.finished.connect(partial(self.viewerDecoded, new_img, post.url, target))
         return new_img    
-    def createEventFilter(self, combo, hbox):
-        class EventFilter(Qtc.QObject):
-            def __init__(self, parent=None):
-                super().__init__(parent)
-                self.combo = combo
-                self.hbox = hbox
-                self.master = parent
-            def eventFilter(self, source, event):
-                if source == self.combo:
-                    if event.type() == Qtc.QEvent.Type.HoverEnter:
-                        self.LabelCombosResizing(self.hbox)
-                    elif event.type() == Qtc.QEvent.Type.HoverLeave:
-                        self.baseLabelSizing(self.hbox)
-                
-                return super().eventFilter(source, event)
-            def LabelCombosResizing(self, hbox):
-                hbox.setStretch(0, 12)
-                hbox.setStretch(1, 1)
-                hbox.setStretch(2, 2)
-            def baseLabelSizing(self, hbox):
-                hbox.setStretch(0, 5)
-                hbox.setStretch(1, 8)
-                hbox.setStretch(2, 2)
-        return EventFilter(self)
     def videoTimerStart(self, slider, player):
         
         if isinstance(slider, Qtw.QSlider) and player:
@@ -1145,9 +2456,31 @@ class SearchPage(Qtw.QFrame):
     @Qtc.pyqtSlot(object, str)
     def makeMovie_handleGif(self, label, filename):
             movie = QtGui.QMovie(filename)
+            movie.setParent(label)
+            size = QtGui.QImageReader(filename).size()
+            if size.isValid() and (size.width() > self.bucket.width() or size.height() > self.bucket.height()):        #frames come out at card size, not source size
+                movie.setScaledSize(size.scaled(self.bucket, Qtc.Qt.AspectRatioMode.KeepAspectRatio))
             
             label.setMovie(movie)
             label.movie().start()
+            card = self.cardOf(label)
+            if card is not None and not card.onScreen:
+                movie.setPaused(True)
+
+    def cardOf(self, widget):
+        while widget is not None and not isinstance(widget, FeedCard):
+            widget = widget.parentWidget()
+        return widget
+
+    def updateVisibility(self):                                                                                         #offscreen cards stop animating and playing
+        for card in list(self.liveCards):
+            card.setOnScreen(not card.visibleRegion().isEmpty())
+
+    def releaseHiddenFrames(self):
+        now = time.monotonic()
+        for card in list(self.liveCards):
+            if not card.onScreen and now - card.hiddenAt > self.gifIdle:
+                card.releaseFrames()
            
 
 
@@ -1160,72 +2493,24 @@ class SearchPage(Qtw.QFrame):
             item = self.vbox.itemAt(i).widget()
             if not item.size() == Qtc.QSize(int(self.master.width()*0.7), int(self.master.height()*0.9)):
                 item.setFixedSize(int(self.master.width()*0.7), int(self.master.height()*0.9))
-    def handle_video_stack(self, player, btn, json, stack):
-        if not player.source().isValid() or player.source().isEmpty():
-            try:
-                file_url = json['file_url']
-            except:
-                return
-            # os.makedirs('video_assets', exist_ok=True)
-            # if not os.path.exists('video_assets' + file_url):
-                # filename = os.path.join('video_assets', os.path.basename(file_url))
-                # res = requests.get(file_url, stream=True, timeout=10)
-
-                # with open(filename, 'wb') as file:
-                #     file.write(res.content)
-                
-            player.setSource(Qtc.QUrl(file_url))
-            stack.setCurrentWidget(player.videoOutput())
-            
-                # filename = os.path.join('video_assets', file_url)
-                # player.setSource(Qtc.QUrl.fromLocalFile(filename))
-
-            player.play()
-        else:
-            
-            state = player.playbackState()
-            if  state == Qtmedia.QMediaPlayer.PlaybackState.PlayingState:
-                icon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackPause)
-                btn.setIcon(icon)
-                player.pause()
-            else:
-                icon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackStart)
-                btn.setIcon(icon)
-                player.play()
-    def handle_video(self, player, btn, json):
-        
-        if not player.source().isValid() or player.source().isEmpty():
-            try:
-                file_url = json['file_url']
-            except:
-                return
-            # os.makedirs('video_assets', exist_ok=True)
-            # if not os.path.exists('video_assets' + file_url):
-                # filename = os.path.join('video_assets', os.path.basename(file_url))
-                # res = requests.get(file_url, stream=True, timeout=10)
-
-                # with open(filename, 'wb') as file:
-                #     file.write(res.content)
-            F = Qtc.QUrl(file_url)
-            player.setSource(F)
-            
-                # filename = os.path.join('video_assets', file_url)
-                # player.setSource(Qtc.QUrl.fromLocalFile(filename))
-
-            player.play()
-        else:
-            
-            state = player.playbackState()
-            if  state == Qtmedia.QMediaPlayer.PlaybackState.PlayingState:
-                icon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackPause)
-                btn.setIcon(icon)
-                player.pause()
-            else:
-                icon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackStart)
-                btn.setIcon(icon)
-                player.play()
+        self.updateVirtualWindow()
+        if self.feedModel is not None:
+            self.scr.doItemsLayout()
+        self.updateVisibility()
+
+        bucket = self.cardBucket()
+        if bucket.width() > self.bucket.width() or bucket.height() > self.bucket.height():                             #only grow, shrinking keeps the sharper decode
+            self.bucket = self.bucket.expandedTo(bucket)
+            for worker in self.workers:
+                worker.targetSize = self.bucket
+            self.redecodeVisible()
+    def mediaSource(self, file_url):
+        path = cacheFor(file_url).path(file_url)
+        if path:
+            return Qtc.QUrl.fromLocalFile(os.path.abspath(path))
+        return Qtc.QUrl(file_url)
     #AHHHHHHH SHOULD BE A IMAGE DOWNLOAD
-    def save_feature(self, json, btn):
+    def save_feature(self, json, btn, post=None):
         
         def nested_search(DIC, target):
             for key, value in DIC.items():
@@ -1236,7 +2521,6 @@ class SearchPage(Qtw.QFrame):
                     if found:
                         return found
             return None
-        filepath = os.path.join('origin','saves.txt')
         if btn.state == 0:
             file_url = nested_search(json, 'file_url')
             print(file_url)
@@ -1246,37 +2530,17 @@ class SearchPage(Qtw.QFrame):
             icon = QtGui.QIcon('origin/assets/red-heart-icon.png')
             btn.setIcon(icon)
             btn.state = 1
-            alreadyThereFlag = False
-            if os.path.exists(os.path.join(filepath)):
-              
-
-                with open(filepath, 'r+') as file:
-                    lines = file.readlines()
-                    for line in lines:
-                        if line == file_url:
-                            alreadyThereFlag = True
-                            break
-                    if not alreadyThereFlag:
-                        file.seek(0, os.SEEK_END)
-                        file.write(file_url + '\n')
-
-            else:
-                with open(filepath, 'w') as file:
-                    file.write(file_url + '\n')
+            if saveCatalog.has(file_url):
+                return
 
-            
-            downloadsFilePath = os.path.join('origin', 'saveImg')
-            if not os.path.exists(downloadsFilePath):
-                os.mkdir(downloadsFilePath)
-           
-            if not alreadyThereFlag:
-                saved_img = os.path.join(downloadsFilePath, os.path.basename(file_url))
-                req = requests.get(file_url, stream=True, timeout=10)
-                with open(saved_img, 'wb') as file:
-                    file.write(req.content)
+            data = post.data if post is not None and post.complete else None
+            task = saveQueue.save(file_url, json, data)
+            task.received.connect(partial(self.saveProgress, btn))
+            task.finished.connect(partial(self.saveDone, btn))
+            task.failed.connect(partial(self.saveFailed, btn, post))
             
         
-        elif btn.state == 1 and os.path.exists(filepath):
+        elif btn.state == 1:
             icon = QtGui.QIcon('origin/assets/loveheart_empty.png')
             btn.setIcon(icon)
 
@@ -1285,20 +2549,27 @@ class SearchPage(Qtw.QFrame):
             except:
                     return
 
-
-            with open(filepath, 'r') as file:
-                lines = file.readlines()
-                
-            with open(filepath, 'w') as file:
-                for line in lines:
-                    if line.strip() != file_url:
-                        file.write(line)
-            if os.path.exists(os.path.join('origin', 'saveImg', os.path.basename(file_url))):
-                os.remove(os.path.join('origin', 'saveImg', os.path.basename(file_url)))
+            saveQueue.unsave(file_url)
+            btn.setToolTip("")
             btn.state = 0
-        print(os.path.exists(filepath))
         print(btn.icon())
-        print(QtGui.QIcon('origin/assets/loveheart_empty.png'))
+
+    def saveProgress(self, btn, received):
+        if not sip.isdeleted(btn) and btn.state == 1:
+            btn.setToolTip("Saving... {:.1f} MB".format(received / (1024 * 1024)))
+
+    def saveDone(self, btn, duplicate):
+        if not sip.isdeleted(btn) and btn.state == 1:
+            btn.setToolTip("Already saved as " + os.path.basename(duplicate) if duplicate else "Saved")
+
+    def saveFailed(self, btn, post, error):
+        print(error)
+        if post is not None:
+            post.saved = 0
+        if not sip.isdeleted(btn):
+            btn.setIcon(QtGui.QIcon('origin/assets/loveheart_empty.png'))
+            btn.setToolTip("Save failed: " + error)
+            btn.state = 0
 
 
     
@@ -1405,6 +2676,8 @@ class ImageViewer(Qtw.QWidget):
     def copyWidget_original_size(self, widget):
         if widget is None:
             return None
+        if isinstance(widget, FeedCard):
+            widget.populate()
         if isinstance(widget, videoContainer):
             new_widget = self.master.copyVid(widget)
             
@@ -1430,6 +2703,8 @@ class ImageViewer(Qtw.QWidget):
     def copyWidget(self, widget):
         if widget is None:
             return None
+        if isinstance(widget, FeedCard):
+            widget.populate()
         if isinstance(widget, videoContainer):
             new_widget = self.master.copyVid(widget)
             new_widget.setMaximumHeight(int(self.height()*0.9))
@@ -1472,10 +2747,414 @@ class ImageViewer(Qtw.QWidget):
                     new_layout.addLayout(self.copyLayout(item.layout()))
         return new_layout
     
+class FeedCard(Qtw.QWidget):
+    def __init__(self, page, post, index):
+        super().__init__()
+        self.page = page
+        self.post = post
+        self.index = index
+        self.body = None
+        self.video = None
+        self.gifLabel = None
+        self.onScreen = True
+        self.hiddenAt = 0.0
+        self.resumePlayer = False
+        self.framesReleased = False
+        self.cardLayout = Qtw.QVBoxLayout(self)
+        self.cardLayout.setContentsMargins(0,0,0,0)
+
+    def setOnScreen(self, onScreen):
+        if onScreen == self.onScreen:
+            return
+        self.onScreen = onScreen
+        self.hiddenAt = time.monotonic()
+        movie = self.gifLabel.movie() if self.gifLabel is not None else None
+        if onScreen:
+            if self.framesReleased:
+                self.framesReleased = False
+                gifPool.load(self.gifLabel, self.post.json, self.page.makeMovie_handleGif)
+            elif movie is not None:
+                movie.setPaused(False)
+            if self.resumePlayer:
+                self.resumePlayer = False
+                self.video.play()
+        else:
+            if movie is not None and movie.state() == QtGui.QMovie.MovieState.Running:
+                movie.setPaused(True)
+            if self.video is not None and self.video.release():                                                         #the player goes back to the pool
+                self.resumePlayer = True
+
+    def releaseFrames(self):                                                                                            #the gif comes back from the media cache when scrolled to
+        if self.gifLabel is None or self.framesReleased:
+            return
+        movie = self.gifLabel.movie()
+        if movie is None:
+            return
+        self.gifLabel.clear()
+        movie.stop()
+        movie.deleteLater()
+        self.framesReleased = True
+
+    def isLive(self):
+        return self.body is not None
+
+    def populate(self):
+        if self.body is not None:
+            return
+        self.body = Qtw.QWidget()
+        self.page.buildCard(self, self.body)
+        self.cardLayout.addWidget(self.body)
+        self.page.liveCards.add(self)
+
+    def collapse(self):
+        if self.body is None:
+            return
+        self.cardLayout.removeWidget(self.body)
+        if self.video is not None:
+            self.video.release()
+        self.video = None
+        self.gifLabel = None
+        self.resumePlayer = False
+        self.framesReleased = False
+        self.body.setParent(None)
+        self.body.deleteLater()
+        self.body = None
+        self.page.liveCards.discard(self)
+                                                                                                                        #drop everything decoded, the caches can bring it back
+        post = self.post
+        post.label = None
+        post.previewLabel = None
+        post.pixmap = None
+        post.image = None
+        post.data = None
+        if post.vidFlag[0]:
+            post.vidFlag[1] = None
+
+class MetadataCombo(Qtw.QComboBox):                                                                                     #holds only the post, the page's shared popup shows its tags
+    def __init__(self, page, json):
+        super().__init__()
+        self.page = page
+        self.json = json
+        self.setPlaceholderText("tags")
+
+    def showPopup(self):
+        self.page.showMetadata(self)
+
+
+class MetadataPopup(Qtw.QFrame):                                                                                        #one per page, refilled from whichever card opened it
+    def __init__(self, page):
+        super().__init__(page, Qtc.Qt.WindowType.Popup)
+        self.page = page
+        self.list = Qtw.QListWidget(self)
+        self.list.setFlow(Qtw.QListView.Flow.LeftToRight)
+        self.list.setWrapping(True)
+        self.list.setResizeMode(Qtw.QListView.ResizeMode.Adjust)
+        self.list.setSpacing(2)
+        self.list.itemClicked.connect(self.picked)
+        layout = Qtw.QVBoxLayout(self)
+        layout.setContentsMargins(0,0,0,0)
+        layout.addWidget(self.list)
+
+    def showFor(self, combo):
+        self.list.clear()
+        json = combo.json
+        for key in ("score", "rating"):
+            if key in json:
+                self.addEntry(key + ": " + str(json[key]), key + ":" + str(json[key]), False)
+        for tag in str(json.get('tags', '')).split():
+            self.addEntry(tag, tag, True)
+        self.resize(max(combo.width(), 320), 240)
+        self.move(combo.mapToGlobal(Qtc.QPoint(0, combo.height())))
+        self.show()
+
+    def addEntry(self, text, query, isTag):
+        item = Qtw.QListWidgetItem(text, self.list)
+        item.setData(Qtc.Qt.ItemDataRole.UserRole, (query, isTag))
+
+    def picked(self, item):
+        query, isTag = item.data(Qtc.Qt.ItemDataRole.UserRole)
+        self.hide()
+        self.page.whatToPullCustom(self.page.comp, query)
+        if isTag:
+            self.page.insertText(self.page.tag_input, query, self.page.suggestionView)
+
+
+class SuggestionModel(Qtc.QAbstractListModel):
+    def __init__(self):
+        super().__init__()
+        self.names = []
+        self.counts = []
+
+    def rowCount(self, parent=Qtc.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.names)
+
+    def data(self, index, role=Qtc.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qtc.Qt.ItemDataRole.DisplayRole:
+            return "{}  {}".format(self.names[index.row()], self.counts[index.row()])
+        return None
+
+    def setSuggestions(self, names, counts):
+        self.beginResetModel()
+        self.names = names
+        self.counts = counts
+        self.endResetModel()
+
+
+class FeedModel(Qtc.QAbstractListModel):
+    PostRole = Qtc.Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self, page):
+        super().__init__()
+        self.page = page
+        self.posts = []
+
+    def rowCount(self, parent=Qtc.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.posts)
+
+    def data(self, index, role=Qtc.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        post = self.posts[index.row()]
+        if role == self.PostRole:
+            return post
+        if role == Qtc.Qt.ItemDataRole.ToolTipRole and self.page.master.tool_tips:
+            return post.json.get('tags', None)
+        return None
+
+    def appendPost(self, post):
+        post.row = len(self.posts)
+        self.beginInsertRows(Qtc.QModelIndex(), post.row, post.row)
+        self.posts.append(post)
+        self.endInsertRows()
+
+    def postChanged(self, post):
+        if 0 <= post.row < len(self.posts) and self.posts[post.row] is post:
+            index = self.index(post.row)
+            self.dataChanged.emit(index, index)
+
+    def clear(self):
+        self.beginResetModel()
+        self.posts = []
+        self.endResetModel()
+                                                                                                                        #the image viewer only needs count and itemAt
+    def count(self):
+        return len(self.posts)
+
+    def itemAt(self, row):
+        if 0 <= row < len(self.posts):
+            return Qtw.QWidgetItem(self.page.detachedCard(row))
+        return None
+
+class FeedDelegate(Qtw.QStyledItemDelegate):
+    def __init__(self, page, parent=None):
+        super().__init__(parent)
+        self.page = page
+        self.savedIcon = QtGui.QIcon('origin/assets/red-heart-icon.png')
+        self.emptyIcon = QtGui.QIcon('origin/assets/loveheart_empty.png')
+
+    def cardRect(self, rect):
+        width = min(rect.width(), int(self.page.master.width()*0.7))
+        return Qtc.QRect(rect.x() + (rect.width() - width)//2, rect.y(), width, rect.height()).adjusted(0, 4, 0, -4)
+
+    def sizeHint(self, option, index):
+        return Qtc.QSize(int(self.page.master.width()*0.7), int(self.page.master.height()*0.9) + 8)
+
+    def paint(self, painter, option, index):
+        post = index.data(FeedModel.PostRole)
+        if post is None:
+            return
+        rect = self.cardRect(option.rect)
+        line = option.fontMetrics.height() + 8
+        imageRect = rect.adjusted(0, 0, 0, -line)
+        painter.save()
+        painter.fillRect(imageRect, option.palette.alternateBase())
+        pixmap = self.page.postPixmap(post)
+        if pixmap is None and post.image is not None:                                                                   #still arriving, show what there is
+            pixmap = post.image
+        if pixmap is not None and not pixmap.isNull():
+            size = pixmap.size().scaled(imageRect.size(), Qtc.Qt.AspectRatioMode.KeepAspectRatio)
+            target = Qtc.QRect(0, 0, size.width(), size.height())
+            target.moveCenter(imageRect.center())
+            if isinstance(pixmap, QtGui.QImage):
+                painter.drawImage(target, pixmap)
+            else:
+                painter.drawPixmap(target, pixmap)
+        if post.vidFlag[0] or post.gifFlag:
+            badge = "GIF" if post.gifFlag else "\u25B6"
+            painter.drawText(imageRect.adjusted(8, 8, -8, -8), Qtc.Qt.AlignmentFlag.AlignTop | Qtc.Qt.AlignmentFlag.AlignLeft, badge)
+
+        metaRect = Qtc.QRect(rect.x(), imageRect.bottom() + 4, rect.width() - line, line - 8)
+        meta = "score {}  rating {}".format(post.json.get('score', '?'), post.json.get('rating', '?'))
+        painter.drawText(metaRect, Qtc.Qt.AlignmentFlag.AlignVCenter | Qtc.Qt.AlignmentFlag.AlignLeft, option.fontMetrics.elidedText(meta, Qtc.Qt.TextElideMode.ElideRight, metaRect.width()))
+        heartRect = Qtc.QRect(rect.right() - line + 4, imageRect.bottom() + 4, line - 8, line - 8)
+        (self.savedIcon if post.saved else self.emptyIcon).paint(painter, heartRect)
+        painter.restore()
+
+    def createEditor(self, parent, option, index):                                                                      #the rich card, only ever for the row under the mouse
+        post = index.data(FeedModel.PostRole)
+        card = FeedCard(self.page, post, index.row())
+        card.setParent(parent)
+        card.setAutoFillBackground(True)
+        card.populate()
+        return card
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(self.cardRect(option.rect))
+
+    def setEditorData(self, editor, index):
+        pass
+
+    def destroyEditor(self, editor, index):
+        editor.collapse()
+        super().destroyEditor(editor, index)
+
+class FeedView(Qtw.QListView):
+    def __init__(self, page, model):
+        super().__init__()
+        self.page = page
+        self.editorIndex = None
+        self.setModel(model)
+        self.setItemDelegate(FeedDelegate(page, self))
+        self.setUniformItemSizes(True)
+        self.setVerticalScrollMode(Qtw.QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setSelectionMode(Qtw.QAbstractItemView.SelectionMode.NoSelection)
+        self.setEditTriggers(Qtw.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setMouseTracking(True)
+        self.entered.connect(self.interact)
+        self.clicked.connect(self.interact)
+
+    def interact(self, index):
+        if self.editorIndex is not None and self.editorIndex.isValid() and Qtc.QModelIndex(self.editorIndex) == index:
+            return
+        self.dropEditor()
+        self.editorIndex = Qtc.QPersistentModelIndex(index)
+        self.openPersistentEditor(index)
+
+    def dropEditor(self):
+        if self.editorIndex is not None and self.editorIndex.isValid():
+            self.closePersistentEditor(Qtc.QModelIndex(self.editorIndex))
+        self.editorIndex = None
+
 class videoContainer(Qtw.QWidget):
-    def __init__(self, json):
+    def __init__(self, json, page, save_btn=None):
         super().__init__()
         self.json = json
+        self.page = page
+        self.player = None
+        self.video = None
+        self.position = 0
+
+        self.stacked = Qtw.QStackedLayout()
+        self.preview_label = Qtw.QLabel()
+        self.preview_label.setScaledContents(True)
+        self.preview_label.setContentsMargins(0,0,0,0)
+        self.stacked.addWidget(self.preview_label)
+        self.stacked.setContentsMargins(0,0,0,0)
+
+        volIcon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.AudioVolumeMedium)
+        volumeBtn = Qtw.QPushButton(icon=volIcon)
+        self.audio_slider = Qtw.QSlider(self, orientation=Qtc.Qt.Orientation.Vertical)
+        self.audio_slider.setStyleSheet("QSlider {bottom:0;} QSlider::handle:horizontal {margin: 0; height:30px; width:10px; background-color:grey;}  QSlider::grove:horizontal: {height:30px; background-color: blue; border: 1px solid #bbb;}")
+        self.audio_slider.setRange(0,100)
+        self.audio_slider.setValue(50)
+        self.audio_slider.valueChanged.connect(self.setVolume)
+        self.audio_slider.hide()
+        volumeBtn.clicked.connect(lambda: page.sliderShow_audio(self.audio_slider))
+
+        self.video_slider = Qtw.QSlider()
+        self.video_slider.setStyleSheet("QSlider::handle:horizontal {margin: 0; height:10px; width:10px; background-color:grey;}  QSlider::grove:horizontal: {height:10px; background-color: blue; border: 1px solid #bbb;}")
+        self.video_slider.setRange(0,100)
+        self.video_slider.setOrientation(Qtc.Qt.Orientation.Horizontal)
+        self.video_slider.valueChanged.connect(self.seek)
+
+        play_icon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackStart)
+        self.play_btn = Qtw.QPushButton(icon=play_icon)
+        self.play_btn.clicked.connect(self.toggle)
+
+        h_box = Qtw.QHBoxLayout()
+        h_box.addWidget(self.play_btn)
+        h_box.addWidget(self.video_slider)
+        h_box.addWidget(volumeBtn)
+        h_box.setStretch(0, 1)
+        h_box.setStretch(1, 8)
+        h_box.setStretch(2, 1)
+        if save_btn is not None:
+            h_box.addWidget(save_btn)
+            h_box.setStretch(3, 1)
+
+        simpleLayout = Qtw.QVBoxLayout()
+        simpleLayout.addLayout(self.stacked)
+        simpleLayout.addLayout(h_box)
+        simpleLayout.setStretch(0,10)
+        simpleLayout.setStretch(1,2)
+        self.setLayout(simpleLayout)
+
+    def toggle(self):
+        if self.player is None:
+            self.play()
+            return
+        state = self.player.playbackState()
+        if  state == multimedia().QMediaPlayer.PlaybackState.PlayingState:
+            icon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackPause)
+            self.play_btn.setIcon(icon)
+            self.player.pause()
+        else:
+            icon = QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackStart)
+            self.play_btn.setIcon(icon)
+            self.player.play()
+
+    def play(self):
+        try:
+            file_url = self.json['file_url']
+        except:
+            return
+        self.player = playerPool.checkout(self)
+        if self.video is None:
+            from PyQt6.QtMultimediaWidgets import QVideoWidget
+            self.video = QVideoWidget()
+            self.video.setContentsMargins(0,0,0,0)
+            self.stacked.addWidget(self.video)
+        self.player.setVideoOutput(self.video)
+        self.player.audioOutput().setVolume(self.audio_slider.value()/100)
+        self.player.positionChanged.connect(partial(self.page.videoTimerStart, self.video_slider, self.player))
+        self.player.setSource(self.page.mediaSource(file_url))
+        if self.position:
+            self.player.setPosition(self.position)
+        self.stacked.setCurrentWidget(self.video)
+        self.player.play()
+
+    def release(self):                                                                                                  #hand the player back, true if it was playing
+        if self.player is None:
+            return False
+        playing = self.player.playbackState() == multimedia().QMediaPlayer.PlaybackState.PlayingState
+        player = self.player
+        self.playerLost()
+        playerPool.checkin(player)
+        return playing
+
+    def playerLost(self):
+        self.position = self.player.position()
+        self.player = None
+        if self.video is not None:
+            self.stacked.setCurrentWidget(self.preview_label)
+            self.stacked.removeWidget(self.video)
+            self.video.deleteLater()
+            self.video = None
+        self.play_btn.setIcon(QtGui.QIcon.fromTheme(QtGui.QIcon.ThemeIcon.MediaPlaybackStart))
+
+    def setVolume(self, value):
+        if self.player is not None:
+            self.player.audioOutput().setVolume(value/100)
+
+    def seek(self, value):
+        if self.player is not None:
+            self.player.setPosition(int(self.player.duration()*value/100))
 
 class ButtonWithState(Qtw.QPushButton):
     state = 0
@@ -1489,100 +3168,314 @@ class GifWorker(Qtc.QObject):
         super().__init__()
         self.json = json
         self.label = label
+        self.task = None
         
         
     def run(self):
         
-        self.threadActive = True
-
-        os.makedirs('video_assets', exist_ok=True)
         try:
-            file_url = self.json['file_url']
+            self.file_url = self.json['file_url']
         except:
-            file_url = self.json['@file_url']
-        if not os.path.exists(os.path.join('video_assets', os.path.basename(file_url))):
-            filename = os.path.join('video_assets', os.path.basename(file_url))
-            res = requests.get(file_url, stream=True, timeout=10)
-
+            self.file_url = self.json['@file_url']
+        filename = videoCache.path(self.file_url)
+        if filename:
+            self.handle_gif.emit(self.label, filename)
+            self.finished.emit()
+            return
+
+        self.task = fetchEngine.fetch(self.file_url)
+        self.task.finished.connect(self.write)
+        self.task.failed.connect(self.failed)
+
+    def write(self, data):
+        filename = videoCache.path(self.file_url)
+        if filename is None:                                                                                            #cache write failed, fall back to a loose file the next launch sweeps up
+            os.makedirs('video_assets', exist_ok=True)
+            filename = os.path.join('video_assets', videoCache.key(self.file_url) + os.path.splitext(Qtc.QUrl(self.file_url).path())[1])
             with open(filename, 'wb') as file:
-                file.write(res.content)
-
-        else:
-            filename = os.path.join('video_assets', os.path.basename(file_url))
+                file.write(data)
 
         self.handle_gif.emit(self.label, filename)
-        print("Inner Thread" + str(threading.get_ident()))
+        self.finished.emit()
 
+    def failed(self, error):
+        print(error)
         self.finished.emit()
   
     def stop(self):
-        self.threadActive = False
-        self.quit()
+        if self.task is not None:
+            self.task.abort()
 class VidWorker(Qtc.QThread):
     handle_gif = Qtc.pyqtSignal(object, str)
     finished = Qtc.pyqtSignal()
 
 
+class FeedPost:
+    def __init__(self, index, url, json):
+        self.index = index
+        self.url = url
+        self.json = json
+        self.data = None
+        self.image = None
+        self.complete = False
+        self.vidFlag = [False, None]
+        self.gifFlag = False
+        self.shown = False
+        self.label = None
+        self.renderedBytes = 0
+        self.renderedAt = 0.0
+        self.partialTask = None
+        self.bucket = None
+        self.pixmap = None
+        self.saved = int(saveCatalog.has(json.get('file_url', url)))
+        self.row = -1
+        self.mediaType = None
+        self.mediaSize = 0
+        self.previewLabel = None
+        self.previewTask = None
+
+
 class Worker(Qtc.QObject):
-    progress = Qtc.pyqtSignal(bytes, dict, list, bool, name="imageLoad")
+    progress = Qtc.pyqtSignal(object, name="imageLoad")
+    refined = Qtc.pyqtSignal(object)
     finished = Qtc.pyqtSignal(name="imageLoad")
 
-    def __init__(self, url, scraper):
+    partialStep = 64 * 1024                                                                                             #minimum new bytes before another partial render
+    partialInterval = 0.25
+
+    def __init__(self, url, cursor, pid, poolWidth=6, ordered=True, targetSize=None):
         super().__init__()
         self.url = url
-        self.scraper = scraper
+        self.cursor = cursor
+        self.pid = pid
+        self.held = False
+        self.startedAt = 0.0
+        self.targetSize = targetSize
         self.stop = False
+        self.running = False
+        self.poolWidth = max(1, int(poolWidth))
+        self.ordered = ordered
+        self.L = []
+        self.siteJson = None
+        self.inFlight = {}
+        self.previews = {}
+        self.ready = {}
+        self.nextSubmit = 0
+        self.nextEmit = 0
+        self.scrapeTask = None
+        self.scrapeError = False
         
     def run(self):
-      
-
-        
-        siteJson = self.scraper.site.retJson()
-        if siteJson:
-            L = self.scraper.site.imagePop2(siteJson)
-        else:
-            L = self.scraper.site.imagePop()
-
-        i = 0
-        with requests.Session() as session:
-            if siteJson:
-                for i in range(len(L)):
-                    if self.stop:
-                        break
-                    try:
-                        res = session.get(L[i], stream=True)
-                        self.progress.emit(res.content, siteJson[i], self.isVideo(L[i], siteJson[i], session), self.isGif(L[i]))
-
-                    except Exception as e:
-                        print(e)
-                        continue
+        self.running = True
+        self.startedAt = time.monotonic()
+        self.scrapeTask = fetchEngine.call(self.cursor.fetch, self.pid)
+        self.scrapeTask.finished.connect(self.startDownloads)
+        self.scrapeTask.failed.connect(self.scrapeFailed)
+
+    def scrapeFailed(self, error):
+        print(error)
+        self.scrapeError = True
+        self.checkFinished()
+
+    def startDownloads(self, result):
+        self.siteJson, self.L = result
+        self.submitMore()
+        self.checkFinished()
+
+    def submitMore(self):
+        while not self.stop and self.nextSubmit < len(self.L) and len(self.inFlight) < self.poolWidth:                  #keep at most poolWidth downloads in flight
+            i = self.nextSubmit
+            self.nextSubmit += 1
+            post = FeedPost(i, self.L[i], self.siteJson[i] if self.siteJson else {})
+            post.vidFlag = [self.isVideo(post.url), None]
+            post.gifFlag = self.isGif(post.url)
+            progressive = not post.vidFlag[0] and not post.gifFlag
+            if post.gifFlag:                                                                                            #the card's gif pool fetches these
+                post.bucket = self.targetSize
+                post.complete = True
+                self.release(post)
+                continue
+            if progressive:
+                pixmap = pixmapCache.get(post.url, self.targetSize)
+                if pixmap is not None:                                                                                  #seen at this size already, no fetch and no decode
+                    post.pixmap = pixmap
+                    post.bucket = self.targetSize
+                    post.complete = True
+                    self.release(post)
+                    continue
+            if post.vidFlag[0]:                                                                                         #the body waits for the player, the card only needs to know what it is
+                if 'preview_url' in post.json:
+                    self.fetchPreview(post)
+                task = fetchEngine.fetch(post.url, head=True)
+                task.finished.connect(partial(self.probed, post, task))
+                task.failed.connect(lambda error, post=post: self.downloaded(post, None))
+                self.inFlight[i] = task
+                continue
+            task = fetchEngine.fetch(post.url, stream=progressive)
+            if progressive:
+                task.received.connect(partial(self.received, post, task))
+            task.finished.connect(partial(self.downloaded, post))
+            task.failed.connect(partial(self.downloadFailed, post))
+            self.inFlight[i] = task
+
+    def received(self, post, task, size):
+        now = time.monotonic()
+        if self.stop or post.complete:
+            return
+        if size - post.renderedBytes < self.partialStep or now - post.renderedAt < self.partialInterval:
+            return
+        if post.partialTask is not None:
+            return
+        post.renderedBytes = size
+        post.renderedAt = now
+        post.partialTask = imageDecoder.decode(bytes(task.buffer), self.targetSize)                                                      #jpeg decodes whatever scans have arrived
+        post.partialTask.finished.connect(partial(self.partialDecoded, post))
+        post.partialTask.failed.connect(lambda error: setattr(post, 'partialTask', None))
+
+    def partialDecoded(self, post, image):
+        post.partialTask = None
+        if post.complete or image.isNull():
+            return
+        post.image = image
+        self.showable(post)
+
+    def probed(self, post, task, data):
+        post.mediaType = task.headers.get('content-type')
+        try:
+            post.mediaSize = int(task.headers.get('content-length', 0))
+        except ValueError:
+            post.mediaSize = 0
+        self.downloaded(post, None)
+
+    def downloaded(self, post, data):
+        post.data = data
+        post.complete = True
+        if post.partialTask is not None:
+            post.partialTask.abort()
+            post.partialTask = None
+        if post.vidFlag[0]:
+            post.bucket = self.targetSize
+        if not post.vidFlag[0] and not post.gifFlag:
+            post.bucket = self.targetSize
+            task = imageDecoder.decode(data, self.targetSize)
+            task.finished.connect(partial(self.decoded, post))
+            task.failed.connect(lambda error: self.decoded(post, None))
+            self.inFlight[post.index] = task
+            return
+        self.decoded(post, None)
+
+    def fetchPreview(self, post):                                                                                       #runs beside the probe, the card does not wait for it
+        preview = pixmapCache.get(post.json['preview_url'], self.targetSize)
+        if preview is not None:
+            post.vidFlag[1] = preview
+            return
+        post.previewTask = fetchEngine.fetch(post.json['preview_url'])
+        post.previewTask.finished.connect(partial(self.previewed, post))
+        post.previewTask.failed.connect(partial(self.previewFailed, post))
+        self.previews[post.index] = post.previewTask
+
+    def previewed(self, post, preview):
+        post.previewTask = imageDecoder.decode(preview, self.targetSize)
+        post.previewTask.finished.connect(partial(self.previewDecoded, post))
+        post.previewTask.failed.connect(partial(self.previewFailed, post))
+        self.previews[post.index] = post.previewTask
+
+    def previewDecoded(self, post, image):
+        self.previews.pop(post.index, None)
+        post.previewTask = None
+        if not image.isNull():
+            post.vidFlag[1] = image
+            if post.shown and not self.stop:
+                self.refined.emit(post)
+        self.checkFinished()
+
+    def previewFailed(self, post, error):
+        print(error)
+        self.previews.pop(post.index, None)
+        post.previewTask = None
+        self.checkFinished()
+
+    def decoded(self, post, image):
+        self.inFlight.pop(post.index, None)
+        if image is not None and not image.isNull():
+            if post.vidFlag[0]:
+                post.vidFlag[1] = image
             else:
-                for i in range(len(L)):
-                    if self.stop:
-                        break
-                    try:
-                        res = session.get(L[i], stream=True)
-                        self.progress.emit(res.content, {}, self.isVideo(L[i], {}, session), self.isGif(L[i]))
-
-                    except Exception as e:
-                        print(e)
-                        continue
-        self.finished.emit()
-
-    def isVideo(self, url, json, session):
+                post.image = image
+        self.showable(post)
+
+    def downloadFailed(self, post, error):
+        print(error)
+        self.inFlight.pop(post.index, None)
+        if not post.shown and not self.stop:
+            self.ready[post.index] = None
+            self.flush()
+        self.submitMore()
+        self.checkFinished()
+
+    def showable(self, post):
+        self.release(post)
+        if post.complete:
+            self.submitMore()
+            self.checkFinished()
+
+    def release(self, post):
+        if self.stop:
+            return
+        if post.shown:
+            self.refined.emit(post)
+        elif not self.ordered and not self.held:
+            post.shown = True
+            self.progress.emit(post)
+        else:
+            self.ready[post.index] = post
+            self.flush()
+
+    def flush(self):
+        while self.nextEmit in self.ready and not self.stop and not self.held:                                                            #release posts in post order
+            post = self.ready.pop(self.nextEmit)
+            if post:
+                post.shown = True
+                self.progress.emit(post)
+            self.nextEmit += 1
+
+    def releaseHeld(self):                                                                                              #the pages before this one are all out
+        self.held = False
+        if self.ordered:
+            self.flush()
+            return
+        for index in sorted(self.ready):
+            post = self.ready.pop(index)
+            if post and not self.stop:
+                post.shown = True
+                self.progress.emit(post)
+
+    def checkFinished(self):
+        if self.running and not self.inFlight and not self.previews and (self.stop or self.nextSubmit >= len(self.L)):
+            self.running = False
+            self.finished.emit()
+
+    def cancel(self):
+        self.stop = True
+        if self.scrapeTask is not None:
+            self.scrapeTask.abort()
+        for task in list(self.inFlight.values()) + list(self.previews.values()):
+            task.abort()
+        self.inFlight.clear()
+        self.previews.clear()
+        self.checkFinished()
+
+    def isRunning(self):
+        return self.running
+
+    def isVideo(self, url):
         url = url.lower()
         isVideo = False
         video_extensions =['.mp4', '.avi', '.mov', '.mkv']
         for v in video_extensions:
             if url.endswith(v):
                 isVideo = True
-        preview = None
-        if isVideo:
-            if 'preview_url' in json.keys():
-                video_preview = session.get(json['preview_url'], stream=True)
-                preview = video_preview.content
-
-        return [isVideo, preview]
+        return isVideo
     def isGif(self, url):    
         url = url.lower()
         if url.endswith('.gif'):
@@ -1590,45 +3483,6 @@ class Worker(Qtc.QObject):
         else:
             return False
 
-class BottomWorker(Qtc.QObject):
-    progress = Qtc.pyqtSignal(list, list, name="bottom")
-    show = Qtc.pyqtSignal(bool, name="showHide")
-    finished = Qtc.pyqtSignal(name="bottom")
-    # finished = Qtc.pyqtSignal(name="bottom")
-    def __init__(self, scraper):
-        super().__init__()
-        self.scraper = scraper
-    def run(self, atomicint, input_string):  
-        if input_string is not None:      
-            searchFlag = False
-        
-                                                                #check for this need outside
-            if len(input_string[-1]) > 0:
-                if input_string[-1][-1].isdigit():
-                    searchFlag = True
-                elif input_string[-1][-1].isalpha():
-                    searchFlag = True
-                if searchFlag:
-                    try:
-                        if atomicint.get() == 0:                                                            #is this really necessary
-                            tag = input_string[-1]
-                            tagList = self.scraper.site.tagPop(tag)
-                        
-                            
-                                
-                            self.show.emit(True)
-
-                            self.progress.emit(tagList[0], tagList[1])
-                    except:
-                        self.show.emit(False)
-
-            else:
-                self.show.emit(False)
-
-
-
-        self.finished.emit()
-
 class ClickableLabels(Qtw.QLabel):
     clicked = Qtc.pyqtSignal(object, int)
 
@@ -1636,6 +3490,7 @@ class ClickableLabels(Qtw.QLabel):
         super().__init__()
         self.index = index
         self.vbox = vbox
+        self.post = None
         self.installEventFilter(self)
     def eventFilter(self, source, event):
         if source == self:
@@ -1651,14 +3506,17 @@ class TopPage(SearchPage):
 
     def whatToPull(self, url):
         self.comp = url
-        scap = Scraper(url, tags="score:>=50")
+        scap = scraping().Scraper(url, tags="score:>=50")
         self.scraper = scap
+        self.cursor = PageCursor(scap, tagKey(url))
 
         with self.scraper.lock:
             self.loadThread()
 
 class Saves(Qtw.QFrame):
     page = 0
+    order = "Newest"
+    matches = None
     def __init__(self, master):
         super().__init__()
         self.master = master
@@ -1685,6 +3543,15 @@ class Saves(Qtw.QFrame):
             i+=1
         space = Qtw.QSpacerItem(int(self.width()*0.5), 2, Qtw.QSizePolicy.Policy.Expanding)
         pagination_botm.addSpacerItem(space)
+        tag_search = Qtw.QLineEdit()
+        tag_search.setPlaceholderText("tags, -tag to exclude")
+        tag_search.setClearButtonEnabled(True)
+        tag_search.textChanged.connect(partial(self.searchTags, col=colCount, row=rowCount))
+        pagination_botm.addWidget(tag_search)
+        sort_box = Qtw.QComboBox()
+        sort_box.addItems(SaveCatalog.orders)
+        sort_box.currentTextChanged.connect(partial(self.resort, col=colCount, row=rowCount))
+        pagination_botm.addWidget(sort_box)
         for j in range(k-2, k):
             if j > 1:
                 pagination_btn_right = Qtw.QPushButton(text=str(j))
@@ -1717,6 +3584,7 @@ class Saves(Qtw.QFrame):
 
         self.setLayout(self.mainlayout)
         self.initializeGrid(naughtWidget.layout(), colCount, rowCount)
+        thumbStore.backfill(saveCatalog.paths())                                                                        #once per open, not per sort or search
 
         # self.setFixedWidth(self.master.width())
         # self.setFixedHeight(self.master.height())
@@ -1761,37 +3629,41 @@ class Saves(Qtw.QFrame):
         
         self.initializeGrid(self.centralWidgets[-1].layout(), col, row, page)
 
+    def resort(self, order, col, row):
+        self.order = order
+        self.refresh(col, row)
+
+    def searchTags(self, query, col, row):
+        self.matches = saveCatalog.search(query)
+        self.refresh(col, row)
+
+    def refresh(self, col, row):
+        self.page = 0
+        newCenter = self.makeDefaultCentWidget()
+        self.mainlayout.itemAt(0).widget().hide()
+        self.mainlayout.replaceWidget(self.mainlayout.itemAt(0).widget(), newCenter)
+        for widget in self.centralWidgets:
+            widget.deleteLater()
+        self.centralWidgets = [newCenter]
+        self.current = newCenter
+        self.mainlayout.update()
+        self.initializeGrid(newCenter.layout(), col, row)
+
     def initializeGrid(self, grid, colCount, rowCount, page=0):
-        downloads_files_path = os.path.join('origin', 'saveImg')
-        downloads_directory = os.listdir(downloads_files_path)
         maxCount = rowCount * colCount
+        saved = saveCatalog.page(page * maxCount, maxCount, self.order, self.matches)
         row = 0
         col = 0
-        i = page * maxCount
-        maxCount = i + maxCount
-        while i < len(downloads_directory):
-            if i == maxCount:
-                if page >= len(self.centralWidgets):
-                    self.page = page
-                    newCenter = self.makeDefaultCentWidget()
-                    self.centralWidgets.append(newCenter)
-                    self.mainlayout.replaceWidget(self.mainlayout.itemAt(0).widget(), newCenter)
-                    self.mainlayout.update()
-                self.initializeGrid(self, self.centralWidgets[-1].layout(), colCount, rowCount, self.page)
-                return
-           
-                   
-            label = ClickableLabels(i % maxCount, grid)
+        i = 0
+        while i < len(saved):
+            label = ClickableLabels(i, grid)
             label.clicked.connect(partial(self.imageView.initalizeView, grid, i))                        
             # label.setFixedSize(int(self.width()/10), int(self.height()/10))
             label.setScaledContents(True)
             
-            with open(os.path.join(downloads_files_path, downloads_directory[i]), 'rb') as file:
-                content = file.read()
-            img = QtGui.QImage()
-            img.loadFromData(content)
-            pixmap = QtGui.QPixmap.fromImage(img).scaled(img.size(), Qtc.Qt.AspectRatioMode.KeepAspectRatio, Qtc.Qt.TransformationMode.SmoothTransformation)
-            label.setPixmap(pixmap)
+            label.path = saved[i][1]
+            task = imageDecoder.thumbnail(label.path)
+            task.finished.connect(partial(self.setDecoded, label))
             grid.addWidget(label, row, col)
             col+=1
             if col >= colCount:
@@ -1800,8 +3672,8 @@ class Saves(Qtw.QFrame):
             i+=1
         while i < maxCount:
             
-            label = ClickableLabels(i % maxCount, grid)
-            label.clicked.connect(partial(self.imageView.initalizeView, grid, i % maxCount))                        
+            label = ClickableLabels(i, grid)
+            label.clicked.connect(partial(self.imageView.initalizeView, grid, i))                        
             # label.setFixedSize(int(self.width()/10), int(self.height()/10))
             label.setScaledContents(True)
 
@@ -1815,10 +3687,18 @@ class Saves(Qtw.QFrame):
                 row += 1
             i+=1
 
+    def setDecoded(self, label, image):
+        if not sip.isdeleted(label) and not image.isNull():
+            label.setPixmap(QtGui.QPixmap.fromImage(image))
+
     def copyImg(self, current_img):
         new_img = Qtw.QLabel()
         new_img.setScaledContents(True)
         new_img.setPixmap(current_img.pixmap())
+        path = getattr(current_img, 'path', None)
+        if path:                                                                                                        #the grid only holds the thumbnail
+            task = imageDecoder.decodeFile(path, sizeBucket(self.imageView.width(), self.imageView.height()))
+            task.finished.connect(partial(self.setDecoded, new_img))
         return new_img
     # def copyVideo():
 
@@ -1981,7 +3861,13 @@ class Settings(Qtw.QDialog):
                 "backgroundTheme": self.master.backgroundTheme,
                 "searchList": self.master.searchList,
                 "NSFW": self.master.nsfw,
-                "tool_tips": self.master.tool_tips
+                "tool_tips": self.master.tool_tips,
+                "downloadPool": self.master.downloadPool,
+                "orderedFeed": self.master.orderedFeed,
+                "cacheSize": self.master.cacheSize,
+                "videoCacheSize": self.master.videoCacheSize,
+                "pixmapCacheSize": self.master.pixmapCacheSize,
+                "modelFeed": self.master.modelFeed
 
             }
         self.updateSettings(settings)
@@ -2148,47 +4034,15 @@ class AddableCombo(Qtw.QWidget):
 
     
 
-engine = QQmlApplicationEngine()
-
 we = MainWindow()
+startupMark("main window")
 
 
 
 
 
 we.show()
+Qtc.QTimer.singleShot(0, reportStartup)
 app.exec()
 
 app.exit()
-
-try:
-    shutil.rmtree('video_assets')
-    print("Goodbye")
-
-except PermissionError as e:
-
-    target = 'video_assets'
-    if not os.path.isdir(target):
-        raise
-
-    for root, drs, files in os.walk(target, topdown=False):
-        for name in files:
-            file_path = os.path.join(root, name)
-            if name != e.filename:
-                try:
-                    os.remove(file_path)
-                except PermissionError:
-                    pass
-        for name in drs:
-            file_path = os.path.join(root, name)
-            try:
-                shutil.rmtree(file_path)
-            except PermissionError or OSError:
-                pass
-    try:
-        shutil.rmtree(target)
-    except OSError:
-        pass
-
-except:
-    print("Goodbye")